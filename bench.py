@@ -0,0 +1,430 @@
+# bench.py
+"""Benchmarks reproducibles del núcleo de notas.
+
+Genera corpus sintéticos (1k, 10k y 100k notas, con cuerpos cortos y largos, y un
+vocabulario reducido de 45 palabras o uno amplio de seudopalabras con frecuencia de Zipf),
+mide carga, guardado, arranque, render completo, scroll, edición, borrado y
+búsqueda, y deja los resultados en un JSON para comparar entre versiones.
+
+No necesita pantalla: la app se ejecuta sobre `PaginaFalsa`, un sustituto
+mínimo de `ft.Page` que solo cuenta los updates.
+
+    python bench.py                                  # todo, almacén json
+    python bench.py --tamanos 1000 --cuerpos corto   # una pasada rápida
+    python bench.py --vocabularios amplio            # índice con un vocabulario realista
+    python bench.py --almacenes json,sqlite,split --salida antes.json
+    python bench.py --comparar antes.json            # tras un cambio
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+import flet as ft
+
+import main as app
+
+TAMANOS = (1000, 10000, 100000)
+CUERPOS = {"corto": (8, 40), "largo": (250, 600)}  # palabras por nota (mín, máx)
+PALABRAS = (
+    "casa perro gato reunión proyecto cliente factura lista compra viaje tren "
+    "libro idea receta tarea código error servidor nota diario cita médico "
+    "banco correo informe plan semana lunes viernes música película café "
+    "jardín coche madrid playa montaña examen clase python flet diseño"
+).split()
+# léxico amplio: seudopalabras con frecuencia de Zipf, para que el vocabulario crezca
+# con la colección como en notas reales (nombres, números, jerga); las PALABRAS van
+# en cabeza, así las consultas de `buscar` siguen acertando
+LEXICO = 200000
+SILABAS = (
+    "ba be bi bo bu ca ce ci co cu da de di do du fa fe fi fo fu ga go gu la le li lo lu "
+    "ma me mi mo mu na ne ni no nu pa pe pi po pu ra re ri ro ru sa se si so su ta te ti "
+    "to tu va ve vi vo za zo tra tre pla ple cro cri es an en in on ar er or al el ul"
+).split()
+VOCABULARIOS = ("reducido", "amplio")
+COLORES = ("#1E1E1E", "#2C3E50", "#F5E6CC", "#FFC0CB", "#A3D2CA", "#5EAAA8")
+
+
+# -------------------------
+# PÁGINA SIN PANTALLA
+# -------------------------
+class PubSubFalso:
+    """Sesión única: los avisos entre sesiones no llegan a nadie."""
+
+    def subscribe_topic(self, topic, handler):
+        pass
+
+    def send_others_on_topic(self, topic, mensaje):
+        pass
+
+    def unsubscribe_all(self):
+        pass
+
+
+class PaginaFalsa:
+    """Sustituto de `ft.Page` con lo que usa `main`: rutas, vistas y updates."""
+
+    def __init__(self, diferir=False):
+        self.diferir = diferir
+        self.diferidos = []
+        self.views = []
+        self.route = "/"
+        self.on_route_change = None
+        self.on_disconnect = None
+        self.updates = 0
+        self.pubsub = PubSubFalso()
+
+    def go(self, route):
+        self.route = route
+        if self.on_route_change:
+            self.on_route_change(types.SimpleNamespace(route=route))
+
+    def update(self, *controles):
+        self.updates += 1
+
+    def open(self, control):
+        pass
+
+    def close(self, control):
+        pass
+
+    def close_dialog(self):
+        pass
+
+    def run_thread(self, fn, *args):
+        # síncrono, así "arranque" incluye la carga en segundo plano; con `diferir`
+        # queda pendiente y se mide solo hasta el primer pintado
+        if self.diferir:
+            self.diferidos.append((fn, args))
+        else:
+            fn(*args)
+
+    def __getattr__(self, nombre):
+        # bgcolor, title, padding... se asignan libremente; leer lo no asignado da None
+        return None
+
+
+def buscar_controles(control, pred, encontrados=None):
+    """Recorre el árbol de controles y devuelve los que cumplen `pred`."""
+    encontrados = [] if encontrados is None else encontrados
+    if pred(control):
+        encontrados.append(control)
+    for hijo in control._get_children():
+        buscar_controles(hijo, pred, encontrados)
+    return encontrados
+
+
+# -------------------------
+# CORPUS SINTÉTICO
+# -------------------------
+def generar_lexico(semilla=99):
+    """PALABRAS seguidas de LEXICO seudopalabras distintas, y sus pesos acumulados (Zipf)."""
+    rnd = random.Random(semilla)
+    lexico = list(PALABRAS)
+    vistas = set(lexico)
+    while len(lexico) < LEXICO:
+        palabra = "".join(rnd.choices(SILABAS, k=rnd.randint(2, 4)))
+        if rnd.random() < 0.1:
+            palabra += str(rnd.randint(0, 9999))
+        if palabra not in vistas:
+            vistas.add(palabra)
+            lexico.append(palabra)
+    acumulados, total = [], 0.0
+    for rango in range(1, len(lexico) + 1):
+        total += 1 / rango
+        acumulados.append(total)
+    return lexico, acumulados
+
+
+def generar_corpus(n, cuerpo, vocabulario="reducido", semilla=1234):
+    """Lista de `n` notas deterministas (misma semilla, mismo corpus)."""
+    rnd = random.Random(semilla)
+    minimo, maximo = CUERPOS[cuerpo]
+    if vocabulario == "amplio":
+        lexico, acumulados = generar_lexico()
+
+        def elegir(k):
+            return rnd.choices(lexico, cum_weights=acumulados, k=k)
+    else:
+        def elegir(k):
+            return rnd.choices(PALABRAS, k=k)
+    notas = []
+    for i in range(n):
+        palabras = elegir(rnd.randint(minimo, maximo))
+        lineas = [" ".join(palabras[j:j + 12]) for j in range(0, len(palabras), 12)]
+        notas.append({
+            "Type": 1,
+            "nombre": f"{rnd.choice(PALABRAS).capitalize()} {i}",
+            "color": rnd.choice(COLORES),
+            "color2": rnd.choice(COLORES),
+            "text": "\n".join(lineas),
+            "pw": False,
+        })
+    return notas
+
+
+def preparar_directorio(directorio, notas, almacen):
+    """Deja en `directorio` el corpus ya migrado al almacén indicado ("split:zlib" = modo:compresión)."""
+    app.escrituras.flush()  # que no quede ninguna escritura diferida de la pasada anterior
+    for nombre in os.listdir(directorio):
+        ruta = os.path.join(directorio, nombre)
+        shutil.rmtree(ruta) if os.path.isdir(ruta) else os.remove(ruta)
+    app.escribir_json(app.DATA_FILE, notas)
+    modo, _, compresion = almacen.partition(":")
+    app.escribir_json(app.DATA_SETTINGS, dict(app.load_settings(), storage=modo, compresion=compresion))
+    app.tienda = app.TiendaCompartida()
+    app.configurar_almacen(modo, compresion)
+    app.cargar_datos()  # asigna ids / importa al backend
+    app.escrituras.flush()
+    if modo != "json":
+        os.remove(app.DATA_FILE)  # que `disco_bytes` cuente solo los archivos del backend
+
+
+def tamano_en_disco(directorio):
+    return sum(os.path.getsize(os.path.join(directorio, f)) for f in os.listdir(directorio))
+
+
+# -------------------------
+# MEDICIONES
+# -------------------------
+def medir(fn, repeticiones, preparar=None):
+    """Ejecuta `fn` varias veces y devuelve tiempos en ms (min, mediana, max)."""
+    tiempos = []
+    for i in range(repeticiones):
+        if preparar:
+            preparar(i)
+        t0 = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return {
+        "repeticiones": repeticiones,
+        "min_ms": round(min(tiempos), 3),
+        "mediana_ms": round(statistics.median(tiempos), 3),
+        "max_ms": round(max(tiempos), 3),
+    }
+
+
+def bench_corpus(n, cuerpo, vocabulario, almacen, repeticiones, directorio):
+    """Mide todas las operaciones sobre un corpus; devuelve {operacion: tiempos}."""
+    preparar_directorio(directorio, generar_corpus(n, cuerpo, vocabulario), almacen)
+    r = {}
+
+    # Datos: carga y guardado completos con el almacén activo
+    r["cargar_datos"] = medir(app.cargar_datos, repeticiones)
+    notas = app.cargar_datos()
+
+    def guardar():
+        app.guardar_datos(notas)
+        app.escrituras.flush()
+
+    r["guardar_datos"] = medir(guardar, repeticiones)
+    r["disco_bytes"] = tamano_en_disco(directorio)
+
+    # Memoria que ocupa la colección cargada (Python, no RSS del proceso)
+    del notas
+    tracemalloc.start()
+    notas = app.cargar_datos()
+    r["memoria_bytes"] = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Abrir notas en frío: leer (y descomprimir) 200 cuerpos fuera de la caché
+    muestra = random.Random(7).sample(notas.lista(), min(200, len(notas)))
+
+    def leer_cuerpos():
+        cache = getattr(app._almacen, "_leer", None)
+        if cache is not None:
+            cache.cache_clear()
+        for item in muestra:
+            item.get("text")
+
+    r["leer_cuerpos_200"] = medir(leer_cuerpos, repeticiones)
+
+    # Cada arranque en frío parte de una tienda vacía, como un proceso recién lanzado
+    def tienda_nueva(i=0):
+        app.tienda = app.TiendaCompartida()
+
+    # Primer pintado: la ventana vacía, sin esperar a la carga de notas
+    r["primer_pintado"] = medir(lambda: app.main(PaginaFalsa(diferir=True)), repeticiones, preparar=tienda_nueva)
+
+    # Arranque completo: carga + índices + primer render de la ventana del grid
+    paginas = []
+
+    def arrancar():
+        pagina = PaginaFalsa()
+        app.main(pagina)
+        paginas.append(pagina)
+
+    r["arranque"] = medir(arrancar, repeticiones, preparar=tienda_nueva)
+    # Otra sesión del mismo proceso: reutiliza notas e índices ya cargados
+    r["sesion_extra"] = medir(lambda: app.main(PaginaFalsa()), repeticiones)
+    page = paginas[-1]
+    inicio = page.views[0]
+    grid = buscar_controles(inicio, lambda c: isinstance(c, ft.ResponsiveRow))[0]
+    desplazable = buscar_controles(inicio, lambda c: isinstance(c, ft.Column) and c.on_scroll)[0]
+    seeker = buscar_controles(inicio, lambda c: isinstance(c, ft.TextField))[0]
+
+    def tiles():
+        return [c for c in grid.controls if isinstance(c.data, dict) and c.data.get("item")]
+
+    # Render completo de la lista (sin consulta)
+    def render():
+        seeker.value = ""
+        seeker.on_change(None)
+
+    r["render_lista"] = medir(render, repeticiones)
+
+    # Cambio de orden del grid (título, color, modificadas, creación): solo la ventana visible
+    ordenar = buscar_controles(inicio, lambda c: isinstance(c, ft.PopupMenuButton) and c.icon == ft.Icons.SORT)[0]
+
+    def cambiar_orden():
+        for opcion in ordenar.items[::-1]:
+            opcion.on_click(None)
+
+    r["cambiar_orden"] = medir(cambiar_orden, repeticiones)
+
+    # Scroll hasta el final y vuelta: ventana nueva con tiles reciclados/creados
+    def scroll():
+        final = len(app.tienda.data) * (app.GRID_TILE + app.GRID_ESPACIO)
+        for pixels in (final, 0):
+            desplazable.on_scroll(types.SimpleNamespace(pixels=pixels, max_scroll_extent=final, viewport_dimension=800))
+
+    r["scroll"] = medir(scroll, repeticiones)
+
+    # Edición de una nota: abrir /edit, cambiar el texto y guardar
+    def editar_preparar(i):
+        page.go(f"/edit/{tiles()[i % len(tiles())].data['item']['id']}")
+
+    def editar():
+        vista = page.views[-1]
+        vista.data["texto"].value += " editado"
+        boton = buscar_controles(vista, lambda c: isinstance(c, ft.IconButton) and c.icon == ft.Icons.CHECK)[0]
+        boton.on_click(None)
+        app.escrituras.flush()
+
+    r["editar"] = medir(editar, repeticiones, preparar=editar_preparar)
+
+    # Borrado en modo selección: una nota, y un lote de 50 (una sola escritura)
+    seleccionar = buscar_controles(inicio, lambda c: isinstance(c, ft.Container) and c.on_long_press)[0]
+    borrar = buscar_controles(inicio, lambda c: isinstance(c, ft.IconButton) and c.icon == ft.Icons.DELETE_OUTLINE)[0]
+
+    def eliminar_n(n):
+        seleccionar.on_long_press(None)
+        for tile in tiles()[:n]:
+            tile.data["switch"].value = True
+            tile.data["switch"].on_change(None)
+        borrar.on_click(None)
+        app.escrituras.flush()
+
+    r["eliminar"] = medir(lambda: eliminar_n(1), repeticiones)
+    r["eliminar_lote_50"] = medir(lambda: eliminar_n(50), repeticiones)
+
+    # Búsqueda exacta (índice invertido) y tolerante (trigramas, incluye construirlos)
+    consultas = ("proy", "reunión cliente", "factura")
+
+    def buscar():
+        for q in consultas:
+            seeker.value = q
+            seeker.on_change(None)
+
+    r["buscar"] = medir(buscar, repeticiones)
+    page.go("/settings")
+    fuzzy = [
+        s for s in buscar_controles(page.views[-1], lambda c: isinstance(c, ft.Row))
+        if any(isinstance(c, ft.Text) and c.value == "Búsqueda tolerante" for c in s.controls)
+    ][0].controls[-1]
+    page.go("/")
+    fuzzy.value = True
+    fuzzy.on_change(None)
+    consultas = ("proyceto", "reunion clinte", "factra")
+    r["buscar_tolerante"] = medir(buscar, repeticiones)
+    r["updates"] = page.updates
+    app.configurar_almacen("json")
+    return r
+
+
+# -------------------------
+# RESULTADOS
+# -------------------------
+def entorno():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "commit": commit,
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def comparar(anterior, actual):
+    """Imprime la relación actual/anterior de las medianas (>1 es más lento)."""
+    def clave(r):
+        # los resultados anteriores al léxico amplio son todos de vocabulario reducido
+        return r["notas"], r["cuerpo"], r.get("vocabulario", "reducido"), r["almacen"]
+
+    previos = {clave(r): r["operaciones"] for r in anterior["resultados"]}
+    for r in actual["resultados"]:
+        antes = previos.get(clave(r))
+        if not antes:
+            continue
+        for op, t in r["operaciones"].items():
+            if isinstance(t, dict) and isinstance(antes.get(op), dict) and antes[op]["mediana_ms"]:
+                ratio = t["mediana_ms"] / antes[op]["mediana_ms"]
+                marca = "  <-- regresión" if ratio > 1.2 else ""
+                print(f"{r['notas']:>7} {r['cuerpo']:<6} {clave(r)[2]:<8} {r['almacen']:<8} {op:<18} x{ratio:.2f}{marca}")
+
+
+def main_bench(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del núcleo de notas")
+    parser.add_argument("--tamanos", default=",".join(map(str, TAMANOS)))
+    parser.add_argument("--cuerpos", default=",".join(CUERPOS))
+    parser.add_argument("--vocabularios", default=",".join(VOCABULARIOS))
+    parser.add_argument("--almacenes", default="json")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--salida", default="bench_resultados.json")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior")
+    args = parser.parse_args(argv)
+
+    origen = os.getcwd()
+    directorio = tempfile.mkdtemp(prefix="uxio-bench-")
+    resultados = []
+    try:
+        os.chdir(directorio)
+        for n in (int(x) for x in args.tamanos.split(",")):
+            for cuerpo in args.cuerpos.split(","):
+                for vocabulario in args.vocabularios.split(","):
+                    for almacen in args.almacenes.split(","):
+                        print(f"{n} notas, cuerpo {cuerpo}, vocabulario {vocabulario}, almacén {almacen}...", file=sys.stderr)
+                        ops = bench_corpus(n, cuerpo, vocabulario, almacen, args.repeticiones, directorio)
+                        resultados.append({
+                            "notas": n, "cuerpo": cuerpo, "vocabulario": vocabulario,
+                            "almacen": almacen, "operaciones": ops,
+                        })
+    finally:
+        os.chdir(origen)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    salida = {"entorno": entorno(), "resultados": resultados}
+    app.escribir_json(args.salida, salida, indent=2)
+    print(f"Resultados en {args.salida}", file=sys.stderr)
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            comparar(json.load(f), salida)
+
+
+if __name__ == "__main__":
+    main_bench()
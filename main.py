@@ -1,16 +1,183 @@
 # main.py
 import flet as ft
+import argparse
+import atexit
+import bisect
+import collections
+import contextlib
+import functools
+import hashlib
+import heapq
 import json
+import logging
+import mmap
 import os
-import random
-from datetime import date
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+import uuid
+import weakref
+import zlib
+
+try:
+    import lzma
+except ImportError:  # Python compilado sin _lzma: solo queda zlib
+    lzma = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:  # POSIX
+    msvcrt = None
+
+log = logging.getLogger(__name__)
 
 DATA_FILE = "contenedores.json"
 DATA_SETTINGS = "settings.json"
+DATA_JOURNAL = "contenedores.log"
+DATA_SNAPSHOT = "contenedores.snapshot.json"
+JOURNAL_COMPACT_EVERY = 200
+ESCRITURA_DEMORA = 0.3
+ESCRITURA_REINTENTO = 5.0
+UPDATE_INTERVALO = 1 / 60
+DATA_SQLITE = "contenedores.db"
+DATA_INDEX = "contenedores.index.json"
+DATA_SPLIT_INDEX = "contenedores.meta.json"
+DATA_SPLIT_BODIES = "contenedores.cuerpos"
+DATA_LOCK = "contenedores.lock"
+DATA_EN_USO = "contenedores.uso"
+TEMA_NOTAS = "notas"
+DATA_TRANSFERENCIA = "transferencia.json"
+DATA_IMPORTACION = "contenedores.importacion"
+TRANSFERENCIA_LOTE = 1000
+CUERPOS_CACHE_MAX = 256
+CUERPOS_BASURA_MAX = 4 * 1024 * 1024
+SNIPPET_MAX = 160
+CARGA_LOTE = 2000
+ZLIB_NIVEL = 6
+
+# Búsqueda difusa: máximo de resultados, fracción mínima de trigramas y peso del título
+BUSQUEDA_TOP_N = 50
+BUSQUEDA_UMBRAL = 0.4
+PESO_TITULO = 3
+PLEGAR_CACHE = 65536  # palabras distintas con su forma plegada en caché
+
+# Preview: a partir de este tamaño se renderiza por bloques; notas con preview en caché
+PREVIEW_BLOQUES_MIN = 20000
+PREVIEW_CACHE_NOTAS = 8
+
+# Editor: notas desde este tamaño se editan por ventanas sobre una tabla de piezas
+EDITOR_GRANDE_MIN = 200_000
+EDITOR_VENTANA = 20_000
+
+# Métricas opcionales: archivo de volcado, cada cuánto se vuelca y límites del histograma
+DATA_METRICAS = "metricas.json"
+METRICAS_INTERVALO = 5.0
+METRICAS_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# -------------------------
+# MÉTRICAS (opcional)
+# -------------------------
+class Metricas:
+    """Latencias por operación en histogramas, con conteos y bytes movidos.
+
+    Se activa con la variable de entorno UXIO_METRICAS o con `"metricas": true` en
+    settings. Desactivada, cada función decorada con `medir` solo comprueba un flag.
+    El resumen se vuelca a DATA_METRICAS como mucho cada METRICAS_INTERVALO segundos
+    (por la cola de escrituras diferidas) y al cerrar la app.
+    """
+
+    def __init__(self, activas=False, path=DATA_METRICAS):
+        self.activas = activas
+        self.path = path
+        self.ops = {}
+        self._lock = threading.Lock()
+        self._ultimo_volcado = time.monotonic()
+
+    def activar(self):
+        self.activas = True
+
+    def medir(self, nombre, tamano=None):
+        """Decorador; `tamano(args, resultado)` devuelve los bytes de la operación."""
+        def decorador(fn):
+            @functools.wraps(fn)
+            def medida(*args, **kwargs):
+                if not self.activas:
+                    return fn(*args, **kwargs)
+                t0 = time.perf_counter()
+                resultado = fn(*args, **kwargs)
+                ms = (time.perf_counter() - t0) * 1000
+                try:
+                    n = tamano(args, resultado) if tamano else None
+                except Exception:
+                    n = None
+                self.registrar(nombre, ms, n)
+                return resultado
+            return medida
+        return decorador
+
+    def registrar(self, nombre, ms, tamano=None):
+        with self._lock:
+            op = self.ops.get(nombre)
+            if op is None:
+                op = self.ops[nombre] = {"n": 0, "total_ms": 0.0, "max_ms": 0.0, "bytes": 0, "buckets": [0] * (len(METRICAS_BUCKETS_MS) + 1)}
+            op["n"] += 1
+            op["total_ms"] += ms
+            op["max_ms"] = max(op["max_ms"], ms)
+            op["buckets"][bisect.bisect_left(METRICAS_BUCKETS_MS, ms)] += 1
+            if tamano:
+                op["bytes"] += tamano
+            volcar = time.monotonic() - self._ultimo_volcado >= METRICAS_INTERVALO
+            if volcar:
+                self._ultimo_volcado = time.monotonic()
+        if volcar:
+            escrituras.programar(self.path, self.volcar)
+
+    @staticmethod
+    def _percentil(op, p):
+        """Límite superior del bucket donde cae el percentil `p` (ms)."""
+        objetivo = op["n"] * p
+        acumulado = 0
+        for i, c in enumerate(op["buckets"]):
+            acumulado += c
+            if acumulado >= objetivo:
+                return METRICAS_BUCKETS_MS[i] if i < len(METRICAS_BUCKETS_MS) else op["max_ms"]
+        return op["max_ms"]
+
+    def resumen(self):
+        with self._lock:
+            ops = {k: dict(v, buckets=list(v["buckets"])) for k, v in self.ops.items()}
+        for op in ops.values():
+            op["media_ms"] = round(op["total_ms"] / op["n"], 3)
+            op["p50_ms"] = self._percentil(op, 0.5)
+            op["p95_ms"] = self._percentil(op, 0.95)
+            op["total_ms"] = round(op["total_ms"], 3)
+            op["max_ms"] = round(op["max_ms"], 3)
+        return {"buckets_ms": list(METRICAS_BUCKETS_MS), "operaciones": ops}
+
+    def volcar(self):
+        if self.activas and self.ops:
+            # sin pasar por el escribir_json medido, para no medirse a sí mismo
+            escribir_json.__wrapped__(self.path, self.resumen(), indent=2)
+
+
+metricas = Metricas(activas=bool(os.environ.get("UXIO_METRICAS")))
+
+
+def _bytes_archivo(args, resultado):
+    return os.path.getsize(args[0]) if os.path.exists(args[0]) else 0
+
 
 # -------------------------
 # UTILIDADES DE CONFIG
 # -------------------------
+@metricas.medir("disco.settings", lambda a, r: os.path.getsize(DATA_SETTINGS) if os.path.exists(DATA_SETTINGS) else 0)
 def load_settings():
     """Carga settings desde archivo; devuelve valores por defecto si no existe o está corrupto."""
     defaults = {
@@ -18,7 +185,12 @@ def load_settings():
         "font_size": "2",
         "preview": True,
         "bradius": 20.0,
-        "pw": False
+        "pw": False,
+        "storage": "json",
+        "fuzzy": False,
+        "metricas": False,
+        "compresion": "",
+        "orden": "insercion",
     }
     if not os.path.exists(DATA_SETTINGS):
         return defaults
@@ -35,8 +207,184 @@ def load_settings():
 
 
 def save_settings(settings):
-    with open(DATA_SETTINGS, "w", encoding="utf-8") as f:
-        json.dump(settings, f, indent=4, ensure_ascii=False)
+    """Programa la escritura de settings; las ráfagas de cambios se guardan una sola vez."""
+    escrituras.programar(DATA_SETTINGS, lambda: escribir_json(DATA_SETTINGS, dict(settings), indent=4))
+
+
+@metricas.medir("disco.escribir_json", _bytes_archivo)
+def escribir_json(path, obj, indent=None):
+    """Escritura atómica: archivo temporal + rename, nunca deja el destino a medias."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=indent, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+# -------------------------
+# ESCRITURA DIFERIDA (write-behind)
+# -------------------------
+class EscrituraDiferida:
+    """Cola de escrituras en un hilo de fondo que agrupa ráfagas por clave.
+
+    `programar(clave, fn)` sustituye cualquier escritura pendiente con la misma clave,
+    así diez cambios seguidos del mismo archivo acaban en una sola escritura.
+    `flush()` ejecuta lo pendiente en el hilo que llama (cierre de la app, tests).
+
+    Si una escritura falla se registra en el log, se avisa a `al_fallar` (funciones
+    `fn(clave, ex)`; la app muestra un SnackBar) y no se pierde: ella y las que venían
+    detrás vuelven a la cola en el mismo orden (el progreso de una importación nunca
+    adelanta a los datos) y se reintentan cada ESCRITURA_REINTENTO segundos.
+    """
+
+    def __init__(self, demora=ESCRITURA_DEMORA, reintento=ESCRITURA_REINTENTO):
+        self.demora = demora
+        self.reintento = reintento
+        self.ultimo_error = None
+        self.al_fallar = []
+        self._fallando = False
+        self._pendientes = {}
+        self._cond = threading.Condition()
+        self._lock_escritura = threading.Lock()
+        self._hilo = None
+
+    def programar(self, clave, fn):
+        with self._cond:
+            self._pendientes[clave] = fn
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, daemon=True)
+                self._hilo.start()
+            self._cond.notify()
+
+    def _bucle(self):
+        while True:
+            with self._cond:
+                while not self._pendientes:
+                    self._cond.wait()
+            # dejar que la ráfaga termine de acumularse; tras un fallo, dar tiempo al disco
+            time.sleep(self.reintento if self._fallando else self.demora)
+            self.flush()
+
+    @metricas.medir("disco.flush")
+    def flush(self):
+        # el cerrojo de archivo siempre antes que el de la cola (mismo orden que nota_*)
+        fallo = None
+        with bloqueo_archivo, self._lock_escritura:
+            with self._cond:
+                lote, self._pendientes = self._pendientes, {}
+            claves = list(lote)
+            for i, clave in enumerate(claves):
+                try:
+                    lote[clave]()
+                except Exception as ex:
+                    fallo = clave, ex
+                    log.error("No se pudo escribir %s; se reintentará", clave, exc_info=ex)
+                    with self._cond:
+                        # lo programado entretanto sustituye a su clave, pero en su sitio
+                        nuevas = self._pendientes
+                        self._pendientes = {c: nuevas.pop(c, lote[c]) for c in claves[i:]}
+                        self._pendientes.update(nuevas)
+                    break
+            self._fallando = fallo is not None
+        if fallo:
+            self.ultimo_error = fallo[1]
+            for fn in list(self.al_fallar):
+                fn(*fallo)
+
+
+class BloqueoArchivo:
+    """Cerrojo exclusivo sobre DATA_LOCK entre procesos (flock / msvcrt.locking).
+
+    Reentrante dentro del proceso: solo el primer `with` de un hilo toca el archivo.
+    Evita que dos procesos (p. ej. varios workers web) intercalen escrituras.
+    """
+
+    def __init__(self, path=DATA_LOCK):
+        self.path = path
+        self._lock = threading.RLock()
+        self._nivel = 0
+        self._f = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        self._nivel += 1
+        if self._nivel == 1:
+            try:
+                self._f = open(self.path, "a+")
+                if fcntl is not None:
+                    fcntl.flock(self._f, fcntl.LOCK_EX)
+                elif msvcrt is not None:
+                    self._f.seek(0)
+                    msvcrt.locking(self._f.fileno(), msvcrt.LK_LOCK, 1)
+            except OSError:
+                # sin permisos o sin soporte: queda solo el cerrojo entre hilos
+                pass
+        return self
+
+    def __exit__(self, *exc):
+        self._nivel -= 1
+        if self._nivel == 0 and self._f is not None:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(self._f, fcntl.LOCK_UN)
+                elif msvcrt is not None:
+                    self._f.seek(0)
+                    msvcrt.locking(self._f.fileno(), msvcrt.LK_UNLCK, 1)
+            except OSError:
+                pass
+            self._f.close()
+            self._f = None
+        self._lock.release()
+
+
+class UsoAlmacen:
+    """Aviso entre procesos de que hay una app con el almacén abierto (flock sobre DATA_EN_USO).
+
+    La app toma un cerrojo compartido para toda su vida (varios workers pueden convivir);
+    la importación sin pantalla pide uno exclusivo sin esperar y no empieza si hay una app
+    abierta: la app reescribe con lo que tiene en memoria (contenedores.json entero, el
+    índice de split, el snapshot del journal) y borraría lo importado. Va en otro archivo
+    que DATA_LOCK porque flock es por descriptor: dentro de un mismo proceso este cerrojo
+    y el de cada escritura se bloquearían entre sí.
+    msvcrt no tiene cerrojos compartidos: en Windows no se comprueba.
+    """
+
+    def __init__(self, path=DATA_EN_USO):
+        self.path = path
+        self._f = None
+
+    def _tomar(self, operacion):
+        if self._f is not None or fcntl is None:
+            return True
+        try:
+            f = open(self.path, "a+")
+        except OSError:
+            return True
+        try:
+            fcntl.flock(f, operacion)
+        except BlockingIOError:
+            f.close()
+            return False
+        except OSError:
+            # sin soporte (p. ej. algunos sistemas de archivos de red): no se comprueba
+            f.close()
+            return True
+        self._f = f
+        return True
+
+    def compartir(self):
+        """Para la app: espera a que termine una importación en curso y no suelta hasta salir."""
+        return self._tomar(fcntl.LOCK_SH if fcntl else 0)
+
+    def exclusivo(self):
+        """Para la importación sin pantalla: False si alguna app tiene el almacén abierto."""
+        return self._tomar(fcntl.LOCK_EX | fcntl.LOCK_NB if fcntl else 0)
+
+
+bloqueo_archivo = BloqueoArchivo()
+uso_almacen = UsoAlmacen()
+escrituras = EscrituraDiferida()
+atexit.register(metricas.volcar)
+atexit.register(escrituras.flush)
 
 
 # -------------------------
@@ -87,55 +435,205 @@ THEMES = ["Pro", "Tec", "Pastel", "Elegante", "Golden"]
 FONT_SIZES = ["1", "2", "3"]
 RADIUS_OPTIONS = ["0", "5", "10", "15", "20", "25", "30"]
 
-
-def get_theme_colors(theme_name):
-    """Devuelve un dict con colores según el nombre del tema."""
-    if theme_name == "Pro":
-        return {
-            "bg": Colors2.Profl_Fondo,
-            "bg2": Colors2.Profl_FondoSecundario,
-            "text": Colors2.Profl_TextoPrincipal,
-            "a1": Colors2.Profl_Acento1,
-            "a2": Colors2.Profl_Acento2,
-        }
-    if theme_name == "Tec":
-        return {
-            "bg": Colors2.Tec_Fondo,
-            "bg2": Colors2.Tec_Fondo,
-            "text": Colors2.Tec_Texto,
-            "a1": Colors2.Tec_Acento1,
-            "a2": Colors2.Tec_Acento2,
-        }
-    if theme_name == "Pastel":
-        return {
-            "bg": Colors2.Pastel_Fondo,
-            "bg2": Colors2.Pastel_Secundario,
-            "text": Colors2.Pastel_TextoOscuro,
-            "a1": Colors2.Pastel_Acento1,
-            "a2": Colors2.Pastel_Acento2,
-        }
-    if theme_name == "Elegante":
-        return {
-            "bg": Colors2.Elegante_Fondo,
-            "bg2": Colors2.Elegante_FondoSecundario,
-            "text": Colors2.Elegante_Texto,
-            "a1": Colors2.Elegante_Acento1,
-            "a2": Colors2.Elegante_Acento2,
-        }
-    # Golden / fallback
-    return {
+# Grid virtualizado: cuántos tiles se materializan y cómo se pagina al hacer scroll
+GRID_VENTANA = 60
+GRID_PAGINA = 30
+GRID_MARGEN = 30
+GRID_POOL_MAX = 120
+GRID_TILE = 200      # alto de un tile (px); el ancho lo reparte el ResponsiveRow
+GRID_ESPACIO = 10
+
+
+# Paletas precalculadas una sola vez por tema
+THEME_PALETTES = {
+    "Pro": {
+        "bg": Colors2.Profl_Fondo,
+        "bg2": Colors2.Profl_FondoSecundario,
+        "text": Colors2.Profl_TextoPrincipal,
+        "a1": Colors2.Profl_Acento1,
+        "a2": Colors2.Profl_Acento2,
+    },
+    "Tec": {
+        "bg": Colors2.Tec_Fondo,
+        "bg2": Colors2.Tec_Fondo,
+        "text": Colors2.Tec_Texto,
+        "a1": Colors2.Tec_Acento1,
+        "a2": Colors2.Tec_Acento2,
+    },
+    "Pastel": {
+        "bg": Colors2.Pastel_Fondo,
+        "bg2": Colors2.Pastel_Secundario,
+        "text": Colors2.Pastel_TextoOscuro,
+        "a1": Colors2.Pastel_Acento1,
+        "a2": Colors2.Pastel_Acento2,
+    },
+    "Elegante": {
+        "bg": Colors2.Elegante_Fondo,
+        "bg2": Colors2.Elegante_FondoSecundario,
+        "text": Colors2.Elegante_Texto,
+        "a1": Colors2.Elegante_Acento1,
+        "a2": Colors2.Elegante_Acento2,
+    },
+    "Golden": {
         "bg": Colors2.Df,
         "bg2": Colors2.Dfs,
         "text": Colors2.Dt,
         "a1": Colors2.Da1,
         "a2": Colors2.Da2,
-    }
+    },
+}
+THEME_KEYS = ("bg", "bg2", "text", "a1", "a2")
+
+
+def get_theme_colors(theme_name):
+    """Devuelve un dict con colores según el nombre del tema (copia: la app lo muta)."""
+    # Golden / fallback
+    return dict(THEME_PALETTES.get(theme_name, THEME_PALETTES["Golden"]))
+
+
+# -------------------------
+# ESTILOS COMPARTIDOS DE LOS TILES
+# -------------------------
+class EstiloTile:
+    """Objetos de estilo inmutables que comparten todos los tiles de un mismo tema,
+    radio y tamaño de fuente, en lugar de crear animaciones/bordes/gradientes por tile."""
+
+    def __init__(self, colores, radio, ctitle, ctext):
+        self.colores = dict(zip(THEME_KEYS, colores))
+        self.radio = radio
+        self.ctitle = ctitle
+        self.ctext = ctext
+        self.anim_rebote = ft.Animation(600, ft.AnimationCurve.BOUNCE_OUT)
+        self.anim_rebote_io = ft.Animation(600, ft.AnimationCurve.BOUNCE_IN_OUT)
+        self.borde = ft.border.all(1, self.colores["a2"])
+        self.gradiente = ft.LinearGradient(
+            begin=ft.alignment.top_center,
+            end=ft.alignment.bottom_center,
+            colors=[self.colores["bg"], self.colores["bg2"]],
+        )
+        self.margen_texto = ft.margin.only(bottom=45)
+        self.offset = ft.Offset(0, 0)
+
+
+@functools.lru_cache(maxsize=32)
+def estilo_tile(colores, radio, ctitle, ctext):
+    """EstiloTile cacheado por (tema, radio, fuente); `colores` en el orden de THEME_KEYS."""
+    return EstiloTile(colores, radio, ctitle, ctext)
 
 
 # -------------------------
 # FUNCIONES DE DATOS
 # -------------------------
-def cargar_datos():
+def nuevo_id():
+    return uuid.uuid4().hex
+
+
+def calcular_snippet(texto, maximo=SNIPPET_MAX):
+    """Extracto corto para los tiles: espacios normalizados y cortado en una palabra."""
+    # solo se mira el principio del cuerpo, así el coste no depende de su longitud
+    fragmento = " ".join((texto or "")[: maximo * 4].split())
+    if len(fragmento) <= maximo:
+        return fragmento
+    corte = fragmento.rfind(" ", 0, maximo)
+    return fragmento[: corte if corte > 0 else maximo] + "…"
+
+
+class Notas:
+    """Notas indexadas por id estable, en orden de inserción.
+
+    Cambio y búsqueda por id son O(1); reemplazar una nota conserva su posición.
+    Altas, cambios y bajas son en sitio bajo `_lock`, que solo cubre memoria.
+    Iterar recorre las notas (dicts) en orden sobre `vista()`, una tupla versionada:
+    se rehace la primera vez que alguien itera tras un cambio y la comparten todos
+    los lectores hasta el siguiente. Así ningún lector necesita el cerrojo de quien
+    escribe, que puede estar esperando al disco.
+    """
+
+    def __init__(self, items=()):
+        self._por_id = {}
+        self._lock = threading.RLock()
+        self._version = 0
+        self._vista = ()
+        self._version_vista = 0
+        self.migradas = 0
+        self.extender(items)
+
+    def extender(self, items):
+        """Añade notas al final (carga por lotes), completando id y snippet si faltan."""
+        items = list(items)
+        for item in items:
+            # archivos anteriores a los ids o a los snippets: se completan al cargar
+            # (antes de tomar `_lock`: leer un cuerpo perezoso toma el del almacén)
+            if not item.get("id"):
+                item["id"] = nuevo_id()
+                self.migradas += 1
+            if "snippet" not in item:
+                item["snippet"] = calcular_snippet(item.get("text", ""))
+                self.migradas += 1
+        with self._lock:
+            self._por_id.update((item["id"], item) for item in items)
+            self._version += 1
+
+    def vista(self):
+        """Tupla de las notas en orden; la misma mientras no cambie nada."""
+        with self._lock:
+            if self._version_vista != self._version:
+                self._vista, self._version_vista = tuple(self._por_id.values()), self._version
+            return self._vista
+
+    def __iter__(self):
+        return iter(self.vista())
+
+    def __len__(self):
+        return len(self._por_id)
+
+    def __contains__(self, nota_id):
+        return nota_id in self._por_id
+
+    def get(self, nota_id, default=None):
+        return self._por_id.get(nota_id, default)
+
+    def poner(self, item):
+        with self._lock:
+            self._por_id[item["id"]] = item
+            self._version += 1
+
+    def quitar(self, nota_id):
+        with self._lock:
+            self._version += 1
+            return self._por_id.pop(nota_id, None)
+
+    def aplicar_lote(self, poner=(), quitar=()):
+        """Varias altas, cambios y bajas en una sola sección crítica."""
+        with self._lock:
+            for nota_id in quitar:
+                self._por_id.pop(nota_id, None)
+            for item in poner:
+                self._por_id[item["id"]] = item
+            self._version += 1
+
+    def lista(self):
+        """Copia en orden, segura frente a escrituras de otros hilos."""
+        return list(self.vista())
+
+
+@metricas.medir("datos.cargar")
+def cargar_datos(al_lote=None):
+    """Carga las notas (`Notas`) con el almacén activo (ver configurar_almacen).
+
+    Con `al_lote(notas, lote)` las notas se entregan por lotes mientras se leen,
+    para ir pintando la app antes de tenerlas todas.
+    Si había notas sin id se les asigna uno y se guarda, de forma transparente.
+    """
+    notas = _almacen.cargar_por_lotes(al_lote) if al_lote else _almacen.cargar()
+    if notas.migradas:
+        _almacen.guardar(notas)
+        notas.migradas = 0
+    return notas
+
+
+@metricas.medir("disco.leer_json", lambda a, r: os.path.getsize(DATA_FILE) if r else 0)
+def cargar_datos_json():
     """Lee contenedores desde JSON; devuelve lista vacía si no hay o está corrupto."""
     if not os.path.exists(DATA_FILE):
         return []
@@ -146,9 +644,1849 @@ def cargar_datos():
         return []
 
 
-def guardar_datos(lista):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(lista, f, indent=4, ensure_ascii=False)
+def iterar_json_lista(path, bloque=1 << 16):
+    """Recorre una lista JSON elemento a elemento, leyendo el archivo por bloques.
+
+    Si el archivo está corrupto se detiene en el último elemento válido.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf, pos = f.read(bloque), 0
+        abierta = False
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                buf, pos = f.read(bloque), 0
+                if not buf:
+                    return
+                continue
+            if not abierta:
+                if buf[pos] != "[":
+                    return
+                abierta, pos = True, pos + 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                item, fin = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # elemento partido entre bloques: leer más (crece para notas enormes)
+                mas = f.read(max(bloque, len(buf) - pos))
+                if not mas:
+                    return
+                buf, pos = buf[pos:] + mas, 0
+                continue
+            yield item
+            pos = fin
+            if pos > bloque:
+                buf, pos = buf[pos:], 0
+
+
+def anexar_ndjson(path, items, bloque=1 << 16):
+    """Añade `items` a `path`, una línea JSON cada uno; antes descarta la última
+    línea si quedó a medias (corte a mitad de escritura), para no pegarle la siguiente.
+    """
+    with open(path, "ab+") as f:
+        fin = f.seek(0, os.SEEK_END)
+        pos = fin
+        while pos > 0:
+            paso = min(pos, bloque)
+            f.seek(pos - paso)
+            salto = f.read(paso).rfind(b"\n")
+            if salto != -1:
+                pos += salto + 1 - paso
+                break
+            pos -= paso
+        if pos != fin:
+            f.truncate(pos)
+        f.write(b"".join(json.dumps(item, ensure_ascii=False).encode("utf-8") + b"\n" for item in items))
+
+
+def fusionar_importacion(existentes, path):
+    """(nota, reemplazada) por cada nota de `existentes` con las importadas en el NDJSON
+    `path` fusionadas por id: la última versión importada de un id ocupa el sitio de la
+    existente (que va como `reemplazada`) y las nuevas van al final.
+
+    Solo se guarda en memoria un {id: offset} de lo importado; cada nota se relee
+    del archivo al escribirla.
+    """
+    ultimas = {}
+    with open(path, "rb") as f:
+        inicio = 0
+        for linea in f:
+            try:
+                ultimas[json.loads(linea)["id"]] = inicio
+            except (ValueError, KeyError, TypeError):
+                pass
+            inicio += len(linea)
+        for item in existentes:
+            off = ultimas.pop(item.get("id"), None)
+            if off is None:
+                yield item, None
+            else:
+                f.seek(off)
+                yield json.loads(f.readline()), item
+        f.seek(0)
+        inicio = 0
+        for linea in f:
+            try:
+                item = json.loads(linea)
+                if ultimas.get(item["id"]) == inicio:
+                    yield item, None
+            except (ValueError, KeyError, TypeError):
+                pass
+            inicio += len(linea)
+
+
+@metricas.medir("datos.guardar")
+def guardar_datos(notas):
+    """Reescribe todas las notas con el almacén activo."""
+    _almacen.guardar(notas)
+
+
+def sellar_nota(item, previo=None, ahora=None):
+    """Pone `modificado` a la hora actual (epoch) y conserva el `creado` que ya tuviera."""
+    ahora = ahora or time.time()
+    item["creado"] = item.get("creado") or (previo or {}).get("creado") or ahora
+    item["modificado"] = ahora
+
+
+@metricas.medir("datos.crear", lambda a, r: len(a[1].get("text", "")))
+def nota_crear(notas, item):
+    if not item.get("id"):
+        item["id"] = nuevo_id()
+    sellar_nota(item)
+    item["snippet"] = calcular_snippet(item.get("text", ""))
+    _almacen.crear(notas, item)
+
+
+@metricas.medir("datos.actualizar", lambda a, r: len(a[1].get("text", "")))
+def nota_actualizar(notas, item):
+    if item.get("id") in notas:
+        sellar_nota(item, notas.get(item["id"]))
+        item["snippet"] = calcular_snippet(item.get("text", ""))
+        _almacen.actualizar(notas, item)
+
+
+@metricas.medir("datos.parchear", lambda a, r: sum(len(c[2]) for c in a[2]))
+def nota_parchear(notas, item, cambios):
+    """Como nota_actualizar, pero el almacén recibe también los rangos cambiados.
+
+    `item["text"]` ya trae el texto final; `cambios` son los de `TablaPiezas.cambios`.
+    """
+    if item.get("id") in notas:
+        sellar_nota(item, notas.get(item["id"]))
+        item["snippet"] = calcular_snippet(item.get("text", ""))
+        _almacen.parchear(notas, item, cambios)
+
+
+@metricas.medir("datos.eliminar")
+def nota_eliminar(notas, nota_id):
+    if nota_id in notas:
+        _almacen.eliminar(notas, nota_id)
+
+
+@metricas.medir("datos.lote")
+def nota_lote(notas, poner, quitar, sellar=True):
+    """Altas/cambios (`poner`) y bajas (`quitar`, ids) de muchas notas como una sola
+    mutación: el almacén las persiste con una escritura, sea cual sea su número.
+
+    Con `sellar=False` (importaciones) se respetan las fechas que ya traigan las notas.
+    """
+    quitar = [nota_id for nota_id in quitar if nota_id in notas]
+    ahora = time.time()
+    for item in poner:
+        if not item.get("id"):
+            item["id"] = nuevo_id()
+        if sellar or not item.get("modificado"):
+            sellar_nota(item, notas.get(item["id"]), ahora)
+        if dict.__contains__(item, "text"):
+            item["snippet"] = calcular_snippet(item["text"])
+    if poner or quitar:
+        _almacen.lote(notas, poner, quitar)
+
+
+@metricas.medir("datos.importar")
+def nota_importar(poner):
+    """Lote importado directo al almacén, sin la colección cargada (sin pantalla).
+
+    Como nota_lote con `sellar=False`, pero sin notas previas de las que heredar `creado`.
+    """
+    ahora = time.time()
+    for item in poner:
+        if not item.get("modificado"):
+            sellar_nota(item, None, ahora)
+        item["snippet"] = calcular_snippet(item.get("text", ""))
+    if poner:
+        _almacen.importar(poner)
+
+
+def nota_con(item, **campos):
+    """Copia de `item` con `campos` cambiados; una nota perezosa sigue sin leer su cuerpo."""
+    if isinstance(item, NotaPerezosa):
+        return NotaPerezosa(dict(dict.items(item), **campos), item._cuerpos, item.firma)
+    return dict(item, **campos)
+
+
+# -------------------------
+# IMPORTAR / EXPORTAR (NDJSON y carpetas Markdown)
+# -------------------------
+# Todo va nota a nota: en memoria solo está el lote en curso. El progreso se guarda en
+# DATA_TRANSFERENCIA tras cada lote, así una transferencia cortada sigue desde ahí al
+# repetirla con la misma ruta (solo se recuerda una a la vez).
+def es_ruta_ndjson(ruta):
+    """.ndjson/.jsonl es un archivo de una nota por línea; cualquier otra ruta, una carpeta Markdown."""
+    return ruta.endswith((".ndjson", ".jsonl"))
+
+
+def nota_a_markdown(item):
+    """Cabecera `clave: valor JSON` entre `---`, el título como `# ...` y el cuerpo tal cual."""
+    meta = {k: v for k, v in dict.items(item) if k not in ("nombre", "text", "snippet")}
+    cabecera = "".join(f"{k}: {json.dumps(v, ensure_ascii=False)}\n" for k, v in meta.items())
+    return f"---\n{cabecera}---\n# {item.get('nombre', '')}\n\n{item.get('text', '')}"
+
+
+def nota_de_markdown(texto, nombre_archivo):
+    """Inversa de nota_a_markdown; sin cabecera ni `# título` se usa el nombre del archivo."""
+    item = {"Type": 1}
+    if texto.startswith("---\n"):
+        fin = texto.find("\n---\n", 3)
+        if fin != -1:
+            for linea in texto[4:fin].splitlines():
+                clave, _, valor = linea.partition(":")
+                try:
+                    item[clave.strip()] = json.loads(valor)
+                except ValueError:
+                    item[clave.strip()] = valor.strip()
+            texto = texto[fin + 5:]
+    titulo, _, resto = texto.partition("\n")
+    if titulo.startswith("# "):
+        item["nombre"] = titulo[2:].strip()
+        texto = resto[1:] if resto.startswith("\n") else resto
+    else:
+        item["nombre"] = os.path.splitext(nombre_archivo)[0]
+    item["text"] = texto
+    return item
+
+
+def iterar_ndjson(path, desde=0):
+    """(offset tras la línea, nota) por cada línea desde el byte `desde`; las corruptas se saltan."""
+    with open(path, "rb") as f:
+        f.seek(desde)
+        for linea in f:
+            desde += len(linea)
+            try:
+                item = json.loads(linea)
+            except ValueError:
+                continue
+            if isinstance(item, dict):
+                yield desde, item
+
+
+def iterar_markdown(carpeta, desde=0):
+    """(entradas recorridas, nota) por cada .md de `carpeta`, sin listarla entera en memoria."""
+    with os.scandir(carpeta) as entradas:
+        for i, entrada in enumerate(entradas, 1):
+            if i <= desde or not entrada.name.endswith(".md") or not entrada.is_file():
+                continue
+            with open(entrada.path, "r", encoding="utf-8") as f:
+                yield i, nota_de_markdown(f.read(), entrada.name)
+
+
+def id_importado(valor):
+    """Id de una nota leída de fuera como str, o None si no sirve: va en la ruta
+    `/edit/<id>`, en el índice de orden junto a ids str y como nombre de `<id>.md`."""
+    if valor is None or isinstance(valor, (bool, dict, list)):
+        return None
+    valor = str(valor).strip()
+    if valor in ("", ".", "..") or any(c in valor for c in "/\\:?#\0"):
+        return None
+    return valor
+
+
+def leer_progreso(clave, path=DATA_TRANSFERENCIA):
+    """Estado guardado de la transferencia `clave`, o uno desde cero si el guardado es de otra."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            estado = json.load(f)
+        if estado.get("clave") == clave:
+            return estado
+    except (OSError, ValueError):
+        pass
+    return {"clave": clave, "posicion": 0, "hechas": 0}
+
+
+def terminar_progreso(path=DATA_TRANSFERENCIA):
+    with contextlib.suppress(OSError):
+        os.remove(path)
+
+
+@metricas.medir("transferencia.importar")
+def importar_notas(origen, confirmar, al_progreso=None, tam=TRANSFERENCIA_LOTE):
+    """Importa un .ndjson o una carpeta Markdown por lotes de `tam`; devuelve cuántas notas.
+
+    `confirmar(lote)` persiste cada lote (normalmente con nota_lote). Los ids se pasan a
+    str; las notas sin id, o con uno inservible (ver id_importado), reciben uno derivado
+    de su posición en el origen, así repetir un lote tras un corte reemplaza las mismas
+    notas en vez de duplicarlas. `al_progreso(hechas, fraccion)`
+    se llama tras cada lote (`fraccion` es None en carpetas, que no tienen tamaño).
+    """
+    clave = ["importar", os.path.abspath(origen)]
+    estado = leer_progreso(clave)
+    if os.path.isdir(origen):
+        lectura, total = iterar_markdown(origen, estado["posicion"]), None
+    else:
+        lectura, total = iterar_ndjson(origen, estado["posicion"]), os.path.getsize(origen) or 1
+    hechas = estado["hechas"]
+    lote = []
+
+    def cerrar_lote(posicion):
+        nonlocal hechas, lote
+        confirmar(lote)
+        hechas += len(lote)
+        lote = []
+        # por la misma cola y detrás del almacén: el progreso nunca se adelanta a los datos
+        progreso = dict(estado, posicion=posicion, hechas=hechas)
+        escrituras.programar(DATA_TRANSFERENCIA, lambda: escribir_json(DATA_TRANSFERENCIA, progreso))
+        if al_progreso:
+            al_progreso(hechas, posicion / total if total else None)
+
+    posicion = estado["posicion"]
+    for posicion, item in lectura:
+        item["id"] = id_importado(item.get("id"))
+        if item["id"] is None:
+            item["id"] = hashlib.sha1(f"{clave[1]}:{posicion}".encode("utf-8")).hexdigest()[:32]
+        item.setdefault("Type", 1)
+        lote.append(item)
+        if len(lote) >= tam:
+            cerrar_lote(posicion)
+    if lote:
+        cerrar_lote(posicion)
+    escrituras.flush()
+    terminar_progreso()
+    return hechas
+
+
+@metricas.medir("transferencia.exportar")
+def exportar_notas(items, destino, al_progreso=None, tam=TRANSFERENCIA_LOTE):
+    """Escribe `items` (una lista o un iterable) en un .ndjson (una nota por línea) o en una carpeta Markdown
+    (un `<id>.md` por nota); devuelve cuántas notas se exportaron.
+
+    Cada cuerpo se lee justo al escribirlo, así las notas perezosas no se cargan todas.
+    Retomar un corte exige la misma colección en el mismo orden: se saltan las ya
+    escritas y el .ndjson se recorta al último lote completo.
+    """
+    clave = ["exportar", os.path.abspath(destino)]
+    estado = leer_progreso(clave)
+    # un recorrido en streaming (ver AlmacenNotas.recorrer) no sabe cuántas quedan
+    total = (len(items) or 1) if hasattr(items, "__len__") else None
+    ndjson = es_ruta_ndjson(destino)
+    if ndjson:
+        f = open(destino, "r+b" if estado["hechas"] and os.path.exists(destino) else "wb")
+        f.seek(estado["posicion"])
+        f.truncate()
+    else:
+        os.makedirs(destino, exist_ok=True)
+    hechas = estado["hechas"]
+    try:
+        for i, item in enumerate(items):
+            if i < estado["hechas"]:
+                continue
+            if ndjson:
+                completa = {k: v for k, v in dict.items(item) if k != "snippet"}
+                completa["text"] = item.get("text", "")
+                f.write(json.dumps(completa, ensure_ascii=False).encode("utf-8") + b"\n")
+            else:
+                # ids importados antes de validarlos: el nombre no debe salir de `destino`
+                nombre = id_importado(item["id"]) or hashlib.sha1(str(item["id"]).encode("utf-8")).hexdigest()[:32]
+                with open(os.path.join(destino, f"{nombre}.md"), "w", encoding="utf-8") as md:
+                    md.write(nota_a_markdown(item))
+            hechas = i + 1
+            if hechas % tam == 0:
+                if ndjson:
+                    f.flush()
+                escribir_json(DATA_TRANSFERENCIA, dict(estado, posicion=f.tell() if ndjson else 0, hechas=hechas))
+                if al_progreso:
+                    al_progreso(hechas, hechas / total if total else None)
+    finally:
+        if ndjson:
+            f.close()
+    terminar_progreso()
+    if al_progreso:
+        al_progreso(hechas, 1.0)
+    return hechas
+
+
+# -------------------------
+# DOCUMENTOS GRANDES: TABLA DE PIEZAS
+# -------------------------
+class TablaPiezas:
+    """Texto editable como tabla de piezas sobre el cuerpo original, que no se copia.
+
+    Cada pieza es (buffer, inicio, largo): el buffer 0 es el original y cada
+    `reemplazar` añade el texto nuevo como otro buffer, partiendo solo las piezas
+    afectadas. `cambios` guarda los rangos editados en orden, para que el almacén
+    persista solo eso (ver `nota_parchear`).
+    """
+
+    def __init__(self, original=""):
+        self._buffers = [original]
+        self._piezas = [(0, 0, len(original))] if original else []
+        self._inicios = [0] if original else []
+        self.largo = len(original)
+        self.cambios = []
+
+    def __len__(self):
+        return self.largo
+
+    def __str__(self):
+        return self.texto()
+
+    def _indice(self, pos):
+        return bisect.bisect_right(self._inicios, pos) - 1
+
+    def _partir(self, pos):
+        """Índice de la pieza que empieza en `pos`, partiendo la que lo contiene."""
+        if pos >= self.largo:
+            return len(self._piezas)
+        i = self._indice(pos)
+        b, ini, n = self._piezas[i]
+        corte = pos - self._inicios[i]
+        if corte == 0:
+            return i
+        self._piezas[i:i + 1] = [(b, ini, corte), (b, ini + corte, n - corte)]
+        self._inicios.insert(i + 1, pos)
+        return i + 1
+
+    def texto(self, ini=0, fin=None):
+        fin = self.largo if fin is None else min(fin, self.largo)
+        if ini >= fin:
+            return ""
+        partes = []
+        i = max(0, self._indice(ini))
+        while i < len(self._piezas) and self._inicios[i] < fin:
+            b, off, n = self._piezas[i]
+            desde = max(ini - self._inicios[i], 0)
+            hasta = min(fin - self._inicios[i], n)
+            partes.append(self._buffers[b][off + desde: off + hasta])
+            i += 1
+        return "".join(partes)
+
+    def reemplazar(self, ini, fin, nuevo):
+        ini = max(0, min(ini, self.largo))
+        fin = max(ini, min(fin, self.largo))
+        if ini == fin and not nuevo:
+            return
+        a = self._partir(ini)
+        b = self._partir(fin)
+        nuevas = []
+        if nuevo:
+            self._buffers.append(nuevo)
+            nuevas.append((len(self._buffers) - 1, 0, len(nuevo)))
+        self._piezas[a:b] = nuevas
+        # solo se recalculan los inicios desde la primera pieza tocada
+        pos = self._inicios[a] if a < len(self._inicios) else ini
+        del self._inicios[a:]
+        for _, _, n in self._piezas[a:]:
+            self._inicios.append(pos)
+            pos += n
+        self.largo = pos
+        self.cambios.append((ini, fin, nuevo))
+
+    def inicio_de_linea(self, pos, limite=1000):
+        """Comienzo de la línea que contiene `pos` (buscando como mucho `limite` atrás)."""
+        if pos <= 0:
+            return 0
+        trozo = self.texto(max(0, pos - limite), pos)
+        i = trozo.rfind("\n")
+        return pos - len(trozo) + i + 1 if i >= 0 else max(0, pos - limite)
+
+    def fin_de_linea(self, pos, limite=1000):
+        """Posición tras el primer salto de línea desde `pos`, para no partir líneas."""
+        if pos >= self.largo:
+            return self.largo
+        trozo = self.texto(pos, pos + limite)
+        i = trozo.find("\n")
+        return pos + i + 1 if i >= 0 else pos + len(trozo)
+
+
+def aplicar_cambios(texto, cambios):
+    """Aplica en orden los rangos [(inicio, fin, nuevo), ...] de una TablaPiezas."""
+    for ini, fin, nuevo in cambios:
+        texto = texto[:ini] + nuevo + texto[fin:]
+    return texto
+
+
+# -------------------------
+# ACTUALIZACIONES DE PÁGINA (coalescidas)
+# -------------------------
+class ActualizadorPagina:
+    """Agrupa las llamadas a page.update(): como mucho un envío al cliente por frame.
+
+    `marcar()` deja la página sucia y programa un único `flush()` tras UPDATE_INTERVALO;
+    dentro de `with batch():` no se envía nada hasta salir del bloque más externo.
+    El envío se hace con `lock`, el cerrojo de la sesión (el flush del Timer corre en
+    otro hilo): page.update() recorre los controles y no debe cruzarse con un render a
+    medias de esta sesión; las demás sesiones no lo comparten y envían a la vez.
+    """
+
+    def __init__(self, page, lock, intervalo=UPDATE_INTERVALO):
+        self.page = page
+        self.lock = lock
+        self.intervalo = intervalo
+        self.envios = 0
+        self._sucia = False
+        self._profundidad = 0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def marcar(self):
+        with self._lock:
+            self._sucia = True
+            if self._profundidad or self._timer is not None:
+                return
+            self._timer = threading.Timer(self.intervalo, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        # orden fijo lock -> _lock: marcar() también se llama con `lock` tomado (render)
+        with self.lock:
+            with self._lock:
+                if self._profundidad:
+                    return
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                sucia, self._sucia = self._sucia, False
+            if sucia:
+                self.envios += 1
+                self.page.update()
+
+    @contextlib.contextmanager
+    def batch(self):
+        with self._lock:
+            self._profundidad += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._profundidad -= 1
+                fin = self._profundidad == 0
+            if fin:
+                self.flush()
+
+
+def sincronizado(lock):
+    """Decorador: ejecuta la función con `lock` tomado (handlers frente a hilos de fondo)."""
+    def decorador(fn):
+        @functools.wraps(fn)
+        def con_lock(*args, **kwargs):
+            with lock:
+                return fn(*args, **kwargs)
+        return con_lock
+    return decorador
+
+
+# -------------------------
+# ALMACENES (backends de persistencia)
+# -------------------------
+class AlmacenNotas:
+    """Interfaz común de persistencia.
+
+    `cargar` devuelve las `Notas` que usa la app; `crear`, `actualizar` y `eliminar`
+    aplican la mutación sobre esa colección y la persisten. Por defecto cada cambio
+    reescribe todo con `guardar`; los backends pueden hacerlo fila a fila, y
+    `parchear` puede persistir solo los rangos de texto editados. `lote` aplica
+    muchos cambios juntos con una sola escritura.
+    """
+
+    def cargar(self):
+        raise NotImplementedError
+
+    def cargar_por_lotes(self, al_lote, tam=CARGA_LOTE):
+        """Como `cargar`, llamando a `al_lote(notas, lote)` cada `tam` notas."""
+        notas = self.cargar()
+        lista = notas.lista()
+        for i in range(0, len(lista), tam):
+            al_lote(notas, lista[i:i + tam])
+        return notas
+
+    def guardar(self, notas):
+        raise NotImplementedError
+
+    def crear(self, notas, item):
+        notas.poner(item)
+        self.guardar(notas)
+
+    def actualizar(self, notas, item):
+        notas.poner(item)
+        self.guardar(notas)
+
+    def eliminar(self, notas, nota_id):
+        notas.quitar(nota_id)
+        self.guardar(notas)
+
+    def parchear(self, notas, item, cambios):
+        """Cambio de texto por rangos; por defecto es una actualización normal."""
+        self.actualizar(notas, item)
+
+    def lote(self, notas, poner, quitar):
+        notas.aplicar_lote(poner, quitar)
+        self.guardar(notas)
+
+    def importar(self, poner):
+        """Persiste notas importadas sin tener la colección en memoria (importación sin
+        pantalla). Por defecto carga, aplica y guarda; los backends lo evitan.
+        """
+        self.lote(self.cargar(), poner, [])
+
+    def terminar_importacion(self):
+        """Cierra una importación sin pantalla; los backends que solo anexan en
+        `importar` fusionan aquí lo anexado, una vez. También al cargar, por si
+        la importación se cortó antes de terminar.
+        """
+
+    def recorrer(self):
+        """Notas una a una para exportar sin pantalla. Por defecto carga la colección;
+        los backends que pueden la leen del disco por partes.
+        """
+        return self.cargar().lista()
+
+    def cerrar(self):
+        pass
+
+
+class AlmacenJson(AlmacenNotas):
+    """Formato original: un único contenedores.json reescrito en cada cambio.
+
+    La reescritura va a la cola de escritura diferida, así el handler no espera al
+    disco y varios cambios seguidos se guardan juntos.
+    """
+
+    def cargar(self):
+        self.terminar_importacion()
+        return Notas(cargar_datos_json())
+
+    def cargar_por_lotes(self, al_lote, tam=CARGA_LOTE):
+        """Lee contenedores.json en streaming: cada lote se entrega en cuanto se parsea."""
+        self.terminar_importacion()
+        notas = Notas()
+        if not os.path.exists(DATA_FILE):
+            return notas
+        lote = []
+        for item in iterar_json_lista(DATA_FILE):
+            lote.append(item)
+            if len(lote) >= tam:
+                notas.extender(lote)
+                al_lote(notas, lote)
+                lote = []
+        notas.extender(lote)
+        al_lote(notas, lote)
+        return notas
+
+    def guardar(self, notas):
+        # se ejecuta en el hilo de escritura, sin el cerrojo de la tienda: copia con lista()
+        escrituras.programar(DATA_FILE, lambda: escribir_json(DATA_FILE, notas.lista(), indent=4))
+
+    def importar(self, poner):
+        """Anexa el lote a DATA_IMPORTACION: contenedores.json es un único archivo que
+        no admite anexar, y reescribirlo en cada lote haría la importación cuadrática.
+        """
+        anexar_ndjson(DATA_IMPORTACION, poner)
+
+    def terminar_importacion(self):
+        """Reescribe contenedores.json una sola vez, en streaming, con lo importado fusionado."""
+        with bloqueo_archivo:
+            if not os.path.exists(DATA_IMPORTACION):
+                return
+            escrituras.flush()
+            existentes = iterar_json_lista(DATA_FILE) if os.path.exists(DATA_FILE) else ()
+            tmp = DATA_FILE + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write("[")
+                sep = "\n"
+                for item, _ in fusionar_importacion(existentes, DATA_IMPORTACION):
+                    f.write(sep + json.dumps(item, indent=4, ensure_ascii=False))
+                    sep = ",\n"
+                f.write("\n]")
+            os.replace(tmp, DATA_FILE)
+            os.remove(DATA_IMPORTACION)
+
+    def recorrer(self):
+        """contenedores.json en streaming, sin cargarlo."""
+        self.terminar_importacion()
+        if not os.path.exists(DATA_FILE):
+            return
+        for item in iterar_json_lista(DATA_FILE):
+            if not item.get("id"):
+                item["id"] = nuevo_id()
+            yield item
+
+    def cerrar(self):
+        escrituras.flush()
+
+
+class AlmacenJournal(AlmacenNotas):
+    """Registra altas/cambios/bajas en un log append-only y compacta en segundo plano.
+
+    El snapshot guarda la lista completa junto al último `seq` aplicado; al cargar se
+    reproduce el log a partir de ese `seq`. Si no hay snapshot se importa DATA_FILE.
+    """
+
+    def __init__(self, log_path=DATA_JOURNAL, snapshot_path=DATA_SNAPSHOT, compactar_cada=JOURNAL_COMPACT_EVERY):
+        self.log_path = log_path
+        self.snapshot_path = snapshot_path
+        self.compactar_cada = compactar_cada
+        self.seq = 0
+        self.pendientes = 0
+        self.notas = Notas()
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._compactando = False
+
+    def cargar(self):
+        lista, seq = [], 0
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                    snap = json.load(f)
+                lista, seq = snap.get("notas", []), int(snap.get("seq", 0))
+            except Exception:
+                lista, seq = [], 0
+        else:
+            # primera vez en modo journal: importar el contenedores.json existente
+            lista = cargar_datos_json()
+
+        registros = []
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for linea in f:
+                    try:
+                        rec = json.loads(linea)
+                    except ValueError:
+                        # última línea truncada por un cierre abrupto
+                        break
+                    if rec.get("seq", 0) > seq:
+                        registros.append(rec)
+
+        # registros anteriores a los ids: se aplican por posición antes de asignarlos
+        for rec in registros:
+            if "id" not in rec:
+                self._aplicar_posicional(lista, rec)
+        notas = Notas(lista)
+        for rec in registros:
+            if "id" in rec:
+                self._aplicar(notas, rec)
+        if registros:
+            seq = registros[-1]["seq"]
+
+        with self._lock:
+            self.notas, self.seq, self.pendientes = notas, seq, len(registros)
+        return notas
+
+    @staticmethod
+    def _aplicar_posicional(lista, rec):
+        op, idx = rec.get("op"), rec.get("index", -1)
+        if op == "create":
+            lista.append(rec["item"])
+        elif op == "update" and 0 <= idx < len(lista):
+            lista[idx] = rec["item"]
+        elif op == "delete" and 0 <= idx < len(lista):
+            lista.pop(idx)
+
+    @staticmethod
+    def _aplicar(notas, rec):
+        op = rec.get("op")
+        if op == "batch":
+            notas.aplicar_lote(rec.get("poner", []), rec.get("quitar", []))
+        elif op in ("create", "update"):
+            notas.poner(rec["item"])
+        elif op == "patch":
+            item = rec["item"]
+            if "text" not in item:
+                previo = notas.get(rec["id"]) or {}
+                item = dict(item, text=aplicar_cambios(previo.get("text", ""), rec.get("cambios", [])))
+            notas.poner(item)
+        elif op == "delete":
+            notas.quitar(rec["id"])
+
+    @metricas.medir("disco.journal")
+    def registrar(self, op, nota_id, item=None, cambios=None, lote=None):
+        """Aplica la mutación sobre `self.notas` y la añade al log en una sola sección crítica.
+
+        Un `lote` (poner, quitar) va en un único registro: una línea truncada al
+        cerrar de golpe se descarta entera, así el lote se aplica todo o nada.
+        """
+        with self._lock:
+            self.seq += 1
+            rec = {"seq": self.seq, "op": op, "id": nota_id}
+            if item is not None:
+                rec["item"] = item
+            if lote is not None:
+                rec["poner"], rec["quitar"] = list(lote[0]), list(lote[1])
+            self._aplicar(self.notas, rec)
+            if cambios is not None:
+                # al log van los rangos cambiados, no el cuerpo entero
+                rec["item"] = {k: v for k, v in item.items() if k != "text"}
+                rec["cambios"] = cambios
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self.pendientes += 1
+            lanzar = self.pendientes >= self.compactar_cada and not self._compactando
+            if lanzar:
+                self._compactando = True
+        if lanzar:
+            threading.Thread(target=self.compactar, daemon=True).start()
+
+    def _seq_en_disco(self):
+        """Último `seq` persistido (snapshot y log) sin cargar las notas."""
+        seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                # escribir_json deja "seq" delante de la lista de notas
+                m = re.match(r'\{"seq": (\d+)', f.read(64))
+            seq = int(m.group(1)) if m else 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for linea in f:
+                    try:
+                        seq = max(seq, json.loads(linea).get("seq", 0))
+                    except ValueError:
+                        break
+        return seq
+
+    def importar(self, poner):
+        """Añade el lote al log como un registro `batch`, sin cargar ni compactar: el
+        snapshot se rehace la próxima vez que la app abra y compacte.
+        """
+        with self._lock:
+            if not self.seq:
+                self.seq = self._seq_en_disco()
+            self.seq += 1
+            rec = {"seq": self.seq, "op": "batch", "id": None, "poner": list(poner), "quitar": []}
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+    @metricas.medir("disco.compactar")
+    def compactar(self):
+        """Vuelca la lista a un snapshot atómico y recorta del log lo ya incluido."""
+        with bloqueo_archivo, self._compact_lock:
+            try:
+                with self._lock:
+                    copia, seq = self.notas.lista(), self.seq
+                escribir_json(self.snapshot_path, {"seq": seq, "notas": copia})
+
+                with self._lock:
+                    restantes = []
+                    if os.path.exists(self.log_path):
+                        with open(self.log_path, "r", encoding="utf-8") as f:
+                            for linea in f:
+                                try:
+                                    if json.loads(linea).get("seq", 0) > seq:
+                                        restantes.append(linea)
+                                except ValueError:
+                                    break
+                    tmp = self.log_path + ".tmp"
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        f.writelines(restantes)
+                    os.replace(tmp, self.log_path)
+                    self.pendientes = len(restantes)
+            finally:
+                self._compactando = False
+
+    def crear(self, notas, item):
+        self.registrar("create", item["id"], item)
+
+    def actualizar(self, notas, item):
+        self.registrar("update", item["id"], item)
+
+    def eliminar(self, notas, nota_id):
+        self.registrar("delete", nota_id)
+
+    def parchear(self, notas, item, cambios):
+        self.registrar("patch", item["id"], item, cambios)
+
+    def lote(self, notas, poner, quitar):
+        self.registrar("batch", None, lote=(poner, quitar))
+
+    def guardar(self, notas):
+        """Reescritura completa: reemplaza las notas y compacta de inmediato."""
+        with self._lock:
+            self.notas = notas
+            self.seq += 1
+        self.compactar()
+
+
+class AlmacenSqlite(AlmacenNotas):
+    """Una fila por nota con columnas indexadas; cada cambio toca solo su fila.
+
+    Al cargar solo se leen metadatos y snippet: las notas son perezosas y su "text"
+    se lee por uid al pedirlo. La columna `firma` (ver firma_nota) deja validar el
+    índice de búsqueda sin leer los cuerpos.
+    La primera vez que se abre una base vacía se migra el contenedores.json existente.
+    """
+
+    COLUMNAS = ("Type", "nombre", "color", "color2", "text", "pw")
+
+    def __init__(self, db_path=DATA_SQLITE):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS notas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                uid TEXT,
+                pos INTEGER NOT NULL,
+                Type INTEGER,
+                nombre TEXT,
+                color TEXT,
+                color2 TEXT,
+                text TEXT,
+                pw TEXT,
+                extra TEXT,
+                firma TEXT,
+                creado REAL,
+                modificado REAL
+            );
+            CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT);
+            """
+        )
+        columnas = {c[1] for c in self.conn.execute("PRAGMA table_info(notas)")}
+        if "uid" not in columnas:
+            # bases creadas antes de los ids estables
+            self.conn.execute("ALTER TABLE notas ADD COLUMN uid TEXT")
+        if "firma" not in columnas:
+            # bases anteriores a la carga perezosa: se rellena en cargar()
+            self.conn.execute("ALTER TABLE notas ADD COLUMN firma TEXT")
+        self.conn.executescript(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_notas_uid ON notas(uid);
+            CREATE INDEX IF NOT EXISTS idx_notas_pos ON notas(pos);
+            CREATE INDEX IF NOT EXISTS idx_notas_nombre ON notas(nombre);
+            CREATE INDEX IF NOT EXISTS idx_notas_type ON notas(Type);
+            CREATE INDEX IF NOT EXISTS idx_notas_creado ON notas(creado);
+            CREATE INDEX IF NOT EXISTS idx_notas_modificado ON notas(modificado);
+            """
+        )
+        self.conn.commit()
+
+    def _fila_meta(self, item):
+        """(Type, nombre, color, color2, pw, extra): todo menos el cuerpo."""
+        extra = {k: v for k, v in item.items() if k not in self.COLUMNAS and k not in ("id", "creado", "modificado")}
+        return (
+            item.get("Type"),
+            item.get("nombre"),
+            item.get("color"),
+            item.get("color2"),
+            json.dumps(item.get("pw"), ensure_ascii=False),
+            json.dumps(extra, ensure_ascii=False) if extra else None,
+        )
+
+    def _fila(self, item):
+        meta = self._fila_meta(item)
+        return meta[:4] + (item.get("text"),) + meta[4:]
+
+    def _item(self, fila):
+        """Nota perezosa a partir de (uid, Type, nombre, color, color2, pw, extra, firma, creado, modificado)."""
+        uid, *valores, pw, extra, firma, creado, modificado = fila
+        item = {k: v for k, v in zip(self.COLUMNAS, valores) if v is not None}
+        if creado is not None:
+            item["creado"], item["modificado"] = creado, modificado
+        if pw is not None and json.loads(pw) is not None:
+            item["pw"] = json.loads(pw)
+        if extra:
+            item.update(json.loads(extra))
+        if uid:
+            item["id"] = uid
+        return NotaPerezosa(item, self, firma)
+
+    def _perezosa(self, item):
+        """La versión en memoria de una nota ya escrita: sin "text", que queda en su fila."""
+        return NotaPerezosa({k: v for k, v in dict.items(item) if k != "text"}, self, firma_nota(item))
+
+    @metricas.medir("disco.leer_cuerpo", lambda a, r: len(r))
+    def texto(self, nota_id):
+        with self._lock:
+            fila = self.conn.execute("SELECT text FROM notas WHERE uid = ?", (nota_id,)).fetchone()
+        return (fila[0] if fila else None) or ""
+
+    def _insertar(self, items, pos_inicial, ahora, reemplazar=False):
+        """Inserta filas desde `pos_inicial`; con `reemplazar`, un uid ya existente se
+        actualiza en su sitio (conserva `pos` y `creado`).
+        """
+        filas = [
+            (it.get("id"), pos_inicial + i) + self._fila(it) + (firma_nota(it), it.get("creado") or ahora, it.get("modificado") or ahora)
+            for i, it in enumerate(items)
+        ]
+        sql = "INSERT INTO notas (uid, pos, Type, nombre, color, color2, text, pw, extra, firma, creado, modificado) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        if reemplazar:
+            sql += (
+                " ON CONFLICT(uid) DO UPDATE SET Type = excluded.Type, nombre = excluded.nombre, color = excluded.color, color2 = excluded.color2,"
+                " text = excluded.text, pw = excluded.pw, extra = excluded.extra, firma = excluded.firma, modificado = excluded.modificado"
+            )
+        return self.conn.executemany(sql, filas)
+
+    def _migrar_json(self):
+        migrado = self.conn.execute("SELECT valor FROM meta WHERE clave = 'migrado_json'").fetchone()
+        if migrado:
+            return
+        with self.conn:
+            vacia = self.conn.execute("SELECT COUNT(*) FROM notas").fetchone()[0] == 0
+            if vacia and os.path.exists(DATA_FILE):
+                self._insertar(Notas(cargar_datos_json()), 0, time.time())
+            self.conn.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('migrado_json', '1')")
+
+    def cargar(self):
+        with self._lock:
+            self._migrar_json()
+            filas = self.conn.execute(
+                "SELECT id, uid, Type, nombre, color, color2, pw, extra, firma, creado, modificado FROM notas ORDER BY pos, id"
+            ).fetchall()
+            notas = Notas(self._item(f[1:]) for f in filas)
+            if notas.migradas:
+                # filas sin uid: guardar el id asignado fila a fila
+                with self.conn:
+                    self.conn.executemany(
+                        "UPDATE notas SET uid = ? WHERE id = ?",
+                        [(item["id"], f[0]) for f, item in zip(filas, notas) if not f[1]],
+                    )
+                notas.migradas = 0
+            sin_firma = [item for f, item in zip(filas, notas) if f[8] is None]
+            if sin_firma:
+                # filas anteriores a la columna firma: se lee su texto una única vez
+                with self.conn:
+                    self.conn.executemany("UPDATE notas SET firma = ? WHERE uid = ?", [(firma_nota(it), it["id"]) for it in sin_firma])
+            return notas
+
+    def guardar(self, notas):
+        # los cuerpos perezosos se leen antes de vaciar la tabla de la que salen
+        items = [item.completa() if isinstance(item, NotaPerezosa) else item for item in notas]
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM notas")
+            self._insertar(items, 0, time.time())
+        for item in items:
+            notas.poner(self._perezosa(item))
+
+    def crear(self, notas, item):
+        with self._lock, self.conn:
+            pos = self.conn.execute("SELECT COALESCE(MAX(pos), -1) + 1 FROM notas").fetchone()[0]
+            self._insertar([item], pos, time.time())
+            notas.poner(self._perezosa(item))
+
+    def actualizar(self, notas, item):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE notas SET Type = ?, nombre = ?, color = ?, color2 = ?, text = ?, pw = ?, extra = ?, firma = ?, modificado = ? WHERE uid = ?",
+                self._fila(item) + (firma_nota(item), item.get("modificado") or time.time(), item["id"]),
+            )
+            notas.poner(self._perezosa(item))
+
+    def eliminar(self, notas, nota_id):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM notas WHERE uid = ?", (nota_id,))
+            notas.quitar(nota_id)
+
+    def parchear(self, notas, item, cambios):
+        """Aplica los rangos con substr() dentro de SQLite, sin mandar el cuerpo entero."""
+        fila = self._fila_meta(item)
+        with self._lock, self.conn:
+            for ini, fin, nuevo in cambios:
+                self.conn.execute(
+                    "UPDATE notas SET text = substr(COALESCE(text, ''), 1, ?) || ? || substr(COALESCE(text, ''), ?) WHERE uid = ?",
+                    (ini, nuevo, fin + 1, item["id"]),
+                )
+            self.conn.execute(
+                "UPDATE notas SET Type = ?, nombre = ?, color = ?, color2 = ?, pw = ?, extra = ?, firma = ?, modificado = ? WHERE uid = ?",
+                fila + (firma_nota(item), item.get("modificado") or time.time(), item["id"]),
+            )
+            notas.poner(self._perezosa(item))
+
+    def lote(self, notas, poner, quitar):
+        """Todas las filas en una sola transacción.
+
+        Las notas perezosas sin texto propio (p. ej. recoloreadas con `nota_con`) no
+        tocan la columna text: su cuerpo ni se lee ni se reescribe.
+        """
+        ahora = time.time()
+        cambios = [it for it in poner if it["id"] in notas]
+        altas = [it for it in poner if it["id"] not in notas]
+        sin_texto = [it for it in cambios if isinstance(it, NotaPerezosa) and not dict.__contains__(it, "text")]
+        con_texto = [it for it in cambios if not (isinstance(it, NotaPerezosa) and not dict.__contains__(it, "text"))]
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM notas WHERE uid = ?", [(nota_id,) for nota_id in quitar])
+            self.conn.executemany(
+                "UPDATE notas SET Type = ?, nombre = ?, color = ?, color2 = ?, text = ?, pw = ?, extra = ?, firma = ?, modificado = ? WHERE uid = ?",
+                [self._fila(it) + (firma_nota(it), it.get("modificado") or ahora, it["id"]) for it in con_texto],
+            )
+            self.conn.executemany(
+                "UPDATE notas SET Type = ?, nombre = ?, color = ?, color2 = ?, pw = ?, extra = ?, modificado = ? WHERE uid = ?",
+                [self._fila_meta(it) + (it.get("modificado") or ahora, it["id"]) for it in sin_texto],
+            )
+            if altas:
+                pos = self.conn.execute("SELECT COALESCE(MAX(pos), -1) + 1 FROM notas").fetchone()[0]
+                self._insertar(altas, pos, ahora)
+            notas.aplicar_lote(sin_texto + [self._perezosa(it) for it in con_texto + altas], quitar)
+
+    def recorrer(self):
+        """Filas completas en orden, leídas del cursor según se exportan."""
+        with self._lock:
+            self._migrar_json()
+        filas = self.conn.execute(
+            "SELECT uid, Type, nombre, color, color2, pw, extra, firma, creado, modificado, text FROM notas ORDER BY pos, id"
+        )
+        for fila in filas:
+            item = dict(self._item(fila[:-1]))
+            item.setdefault("id", nuevo_id())
+            item["text"] = fila[-1] or ""
+            yield item
+
+    def importar(self, poner):
+        """Upsert por uid en una transacción, sin leer la tabla."""
+        with self._lock:
+            # antes de la primera fila: una base no vacía ya no migraría contenedores.json
+            self._migrar_json()
+            with self.conn:
+                pos = self.conn.execute("SELECT COALESCE(MAX(pos), -1) + 1 FROM notas").fetchone()[0]
+                self._insertar(poner, pos, time.time(), reemplazar=True)
+
+    def cerrar(self):
+        with self._lock:
+            self.conn.close()
+
+
+class NotaPerezosa(dict):
+    """Nota cuyo "text" vive en el almacén (cuerpos del modo split, filas de SQLite)
+    y se lee solo al pedirlo con `cuerpos.texto(id)`.
+
+    Se comporta como el dict de siempre (`item["text"]`, `item.get("text")`), pero el
+    texto no ocupa memoria hasta que alguien lo necesita (abrir en /edit, indexar).
+    """
+
+    __slots__ = ("_cuerpos", "firma")
+
+    def __init__(self, meta, cuerpos, firma=None):
+        super().__init__(meta)
+        self._cuerpos = cuerpos
+        self.firma = firma
+
+    def __getitem__(self, clave):
+        if clave == "text" and not dict.__contains__(self, "text"):
+            return self._cuerpos.texto(dict.__getitem__(self, "id"))
+        return dict.__getitem__(self, clave)
+
+    def get(self, clave, default=None):
+        if clave == "text" and not dict.__contains__(self, "text"):
+            return self._cuerpos.texto(dict.get(self, "id"))
+        return dict.get(self, clave, default)
+
+    def __contains__(self, clave):
+        return clave == "text" or dict.__contains__(self, clave)
+
+    def completa(self):
+        """Copia como dict normal, con el texto incluido (para exportar o migrar)."""
+        item = dict(self)
+        item["text"] = self.get("text", "")
+        return item
+
+
+# Compresión de cuerpos del modo split: nombre -> (comprimir, descomprimir) sobre bytes
+CODECS_CUERPOS = {
+    "": (lambda datos: datos, lambda datos: datos),
+    "zlib": (lambda datos: zlib.compress(datos, ZLIB_NIVEL), zlib.decompress),
+}
+if lzma is not None:
+    CODECS_CUERPOS["lzma"] = (lzma.compress, lzma.decompress)
+
+
+class AlmacenDividido(AlmacenNotas):
+    """Índice compacto de metadatos + archivo de cuerpos leído por offset.
+
+    El índice (id, título, colores, offset del cuerpo...) se carga entero al arrancar;
+    los cuerpos se leen bajo demanda con una caché LRU acotada. El archivo de cuerpos
+    se abre con mmap: cada lectura es un slice sin copia que se decodifica en el momento,
+    así la memoria residente depende de lo que se abre y no del tamaño del archivo.
+    Cada edición añade el cuerpo nuevo al final del archivo; el espacio muerto se
+    recupera al compactar.
+
+    Con `compresion` ("zlib" o "lzma") cada cuerpo se guarda comprimido por separado,
+    así se sigue leyendo por offset; la LRU guarda ya descomprimidas las notas calientes.
+    El códec del archivo va en el índice y, si no coincide con el pedido, se reescribe.
+    """
+
+    def __init__(self, indice_path=DATA_SPLIT_INDEX, cuerpos_path=DATA_SPLIT_BODIES, cache_max=CUERPOS_CACHE_MAX, compresion=""):
+        self.indice_path = indice_path
+        self.cuerpos_path = cuerpos_path
+        self.importacion_path = indice_path + ".importacion"
+        self.compresion = ""
+        self.compresion_deseada = compresion if compresion in CODECS_CUERPOS else ""
+        self.refs = {}
+        self.basura = 0
+        self.notas = Notas()
+        self._lock = threading.RLock()
+        self._mapa = None
+        self._leer = functools.lru_cache(maxsize=cache_max)(self._leer_disco)
+
+    @metricas.medir("disco.leer_cuerpo", lambda a, r: a[2])
+    def _leer_disco(self, off, n):
+        if n == 0:
+            return ""
+        with self._lock:
+            if self._mapa is None or off + n > len(self._mapa):
+                # primera lectura, o se anexaron cuerpos después de mapear
+                self._cerrar_mapa()
+                with open(self.cuerpos_path, "rb") as f:
+                    self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            descomprimir = CODECS_CUERPOS[self.compresion][1]
+            with memoryview(self._mapa)[off:off + n] as trozo:
+                if self.compresion:
+                    return descomprimir(trozo).decode("utf-8")
+                return str(trozo, "utf-8")
+
+    def _cerrar_mapa(self):
+        if self._mapa is not None:
+            self._mapa.close()
+            self._mapa = None
+
+    def texto(self, nota_id):
+        ref = self.refs.get(nota_id)
+        return self._leer(*ref) if ref else ""
+
+    @metricas.medir("disco.anexar_cuerpo", lambda a, r: r[1])
+    def _anexar(self, texto):
+        datos = CODECS_CUERPOS[self.compresion][0]((texto or "").encode("utf-8"))
+        with self._lock, open(self.cuerpos_path, "ab") as f:
+            off = f.tell()
+            f.write(datos)
+        return off, len(datos)
+
+    def _perezosa(self, item, off, n, firma):
+        meta = {k: v for k, v in dict.items(item) if k != "text"}
+        self.refs[meta["id"]] = (off, n)
+        return NotaPerezosa(meta, self, firma)
+
+    def _programar_indice(self):
+        def escribir():
+            with self._lock:
+                filas = [
+                    dict(dict.items(it), _cuerpo=self.refs[it["id"]], _firma=it.firma)
+                    for it in self.notas.lista()
+                ]
+            escribir_json(self.indice_path, {"version": 1, "compresion": self.compresion, "basura": self.basura, "notas": filas})
+
+        escrituras.programar(self.indice_path, escribir)
+
+    def cargar(self):
+        if not os.path.exists(self.indice_path):
+            # primera vez: partir el contenedores.json existente
+            notas = Notas(cargar_datos_json())
+            self.guardar(notas)
+            notas.migradas = 0
+            return self.notas
+        self.terminar_importacion()
+        try:
+            with open(self.indice_path, "r", encoding="utf-8") as f:
+                guardado = json.load(f)
+        except Exception:
+            guardado = {}
+        self.basura = guardado.get("basura", 0)
+        self.compresion = guardado.get("compresion", "")
+        lista = []
+        for fila in guardado.get("notas", []):
+            off, n = fila.pop("_cuerpo", (0, 0))
+            firma = fila.pop("_firma", None)
+            if not isinstance(firma, str):
+                # índices anteriores guardaban un CRC32: se recalcula al indexar
+                firma = None
+            lista.append(self._perezosa(fila, off, n, firma))
+        self.notas = Notas(lista)
+        if self.compresion != self.compresion_deseada:
+            # cambió el ajuste de compresión: reescribir los cuerpos con el códec nuevo
+            self.guardar(self.notas)
+        return self.notas
+
+    def guardar(self, notas):
+        """Reescribe el archivo de cuerpos sin huecos y el índice completo."""
+        completas = [(item, item.get("text", "")) for item in notas]
+        comprimir = CODECS_CUERPOS[self.compresion_deseada][0]
+        tmp = self.cuerpos_path + ".tmp"
+        nuevas = []
+        with open(tmp, "wb") as f:
+            for item, texto in completas:
+                datos = comprimir(texto.encode("utf-8"))
+                nuevas.append((item, f.tell(), len(datos), firma_nota(item)))
+                f.write(datos)
+        with self._lock:
+            self._cerrar_mapa()
+            os.replace(tmp, self.cuerpos_path)
+            self.compresion = self.compresion_deseada
+            self._leer.cache_clear()
+            self.refs, self.basura = {}, 0
+            self.notas = Notas(self._perezosa(item, off, n, firma) for item, off, n, firma in nuevas)
+        self._programar_indice()
+        escrituras.flush()
+        # la app sigue usando la colección que pasó; se reemplazan sus notas por las perezosas
+        if notas is not self.notas:
+            for item in self.notas:
+                notas.poner(item)
+
+    def _escribir_nota(self, notas, item):
+        previo = self.refs.get(item["id"])
+        off, n = self._anexar(item.get("text", ""))
+        with self._lock:
+            if previo:
+                self.basura += previo[1]
+            nota = self._perezosa(item, off, n, firma_nota(item))
+            self.notas.poner(nota)
+        notas.poner(nota)
+        self._programar_indice()
+        if self.basura > CUERPOS_BASURA_MAX and self.basura > os.path.getsize(self.cuerpos_path) // 2:
+            self.guardar(notas)
+
+    def crear(self, notas, item):
+        self._escribir_nota(notas, item)
+
+    def actualizar(self, notas, item):
+        self._escribir_nota(notas, item)
+
+    def eliminar(self, notas, nota_id):
+        with self._lock:
+            ref = self.refs.pop(nota_id, None)
+            if ref:
+                self.basura += ref[1]
+            self.notas.quitar(nota_id)
+        notas.quitar(nota_id)
+        self._programar_indice()
+
+    def lote(self, notas, poner, quitar):
+        """Un solo anexado al archivo de cuerpos y una sola escritura del índice.
+
+        Las notas perezosas que llegan sin texto propio (p. ej. recoloreadas con
+        `nota_con`) conservan el cuerpo que ya estaba en disco.
+        """
+        comprimir = CODECS_CUERPOS[self.compresion][0]
+        nuevas = []
+        with self._lock:
+            with open(self.cuerpos_path, "ab") as f:
+                for item in poner:
+                    ref = self.refs.get(item["id"])
+                    if ref and isinstance(item, NotaPerezosa) and not dict.__contains__(item, "text"):
+                        nuevas.append(self._perezosa(item, *ref, item.firma))
+                        continue
+                    datos = comprimir(item.get("text", "").encode("utf-8"))
+                    if ref:
+                        self.basura += ref[1]
+                    nuevas.append(self._perezosa(item, f.tell(), len(datos), firma_nota(item)))
+                    f.write(datos)
+            for nota_id in quitar:
+                ref = self.refs.pop(nota_id, None)
+                if ref:
+                    self.basura += ref[1]
+            self.notas.aplicar_lote(nuevas, quitar)
+        if notas is not self.notas:
+            notas.aplicar_lote(nuevas, quitar)
+        self._programar_indice()
+        if self.basura > CUERPOS_BASURA_MAX and self.basura > os.path.getsize(self.cuerpos_path) // 2:
+            self.guardar(notas)
+
+    def _compresion_en_disco(self):
+        """Códec del archivo de cuerpos sin cargar el índice entero."""
+        with open(self.indice_path, "r", encoding="utf-8") as f:
+            # escribir_json deja "compresion" delante de la lista de notas
+            m = re.search(r'"compresion": "(\w*)"', f.read(128))
+        return m.group(1) if m else ""
+
+    def importar(self, poner):
+        """Anexa los cuerpos del lote y sus filas (dicts planos, con su offset) a la
+        importación en curso; el índice se reescribe una sola vez, en terminar_importacion.
+        """
+        if not os.path.exists(self.indice_path):
+            # primera vez: migrar contenedores.json antes de que el índice exista
+            self.cargar()
+            self.notas, self.refs = Notas(), {}
+        escrituras.flush()
+        with self._lock:
+            comprimir = CODECS_CUERPOS[self._compresion_en_disco()][0]
+            filas = []
+            with open(self.cuerpos_path, "ab") as f:
+                for item in poner:
+                    datos = comprimir(item.get("text", "").encode("utf-8"))
+                    fila = {k: v for k, v in dict.items(item) if k != "text"}
+                    fila["_cuerpo"], fila["_firma"] = (f.tell(), len(datos)), firma_nota(item)
+                    filas.append(fila)
+                    f.write(datos)
+            # las filas después de los cuerpos: un corte nunca deja una fila sin su cuerpo
+            anexar_ndjson(self.importacion_path, filas)
+
+    def terminar_importacion(self):
+        """Fusiona las filas importadas en el índice: una sola reescritura."""
+        with bloqueo_archivo, self._lock:
+            if not os.path.exists(self.importacion_path):
+                return
+            escrituras.flush()
+            with open(self.indice_path, "r", encoding="utf-8") as f:
+                guardado = json.load(f)
+            filas = []
+            for fila, previa in fusionar_importacion(guardado.get("notas", []), self.importacion_path):
+                if previa is not None:
+                    guardado["basura"] = guardado.get("basura", 0) + previa.get("_cuerpo", (0, 0))[1]
+                filas.append(fila)
+            guardado["notas"] = filas
+            escribir_json(self.indice_path, guardado)
+            os.remove(self.importacion_path)
+
+    def cerrar(self):
+        escrituras.flush()
+        with self._lock:
+            self._cerrar_mapa()
+
+
+ALMACENES = {
+    "json": AlmacenJson,
+    "journal": AlmacenJournal,
+    "sqlite": AlmacenSqlite,
+    "split": AlmacenDividido,
+}
+STORAGE_MODES = list(ALMACENES)
+
+_almacen = AlmacenJson()
+
+
+def configurar_almacen(modo, compresion=""):
+    """Activa el backend de persistencia indicado; modos desconocidos vuelven a "json".
+
+    `compresion` solo aplica al modo split (cuerpos comprimidos en disco).
+    """
+    global _almacen
+    _almacen.cerrar()
+    clase = ALMACENES.get(modo, AlmacenJson)
+    _almacen = clase(compresion=compresion) if clase is AlmacenDividido else clase()
+    return _almacen
+
+
+# -------------------------
+# BÚSQUEDA: ÍNDICE INVERTIDO
+# -------------------------
+_RE_TOKEN = re.compile(r"\w+")
+
+
+def _quitar_tildes(texto):
+    descompuesto = unicodedata.normalize("NFD", texto)
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+# el vocabulario se repite mucho entre notas: cada palabra distinta se pliega una vez
+_plegar_palabra = functools.lru_cache(maxsize=PLEGAR_CACHE)(_quitar_tildes)
+
+
+def plegar(texto):
+    """Minúsculas y sin tildes ("Canción" -> "cancion", "Niño" -> "nino")."""
+    texto = texto.lower()
+    return texto if texto.isascii() else _quitar_tildes(texto)
+
+
+def tokenizar(texto):
+    """Tokens de `plegar(texto)`; el texto ASCII (lo habitual) no pasa por unicodedata.
+
+    Plegar por palabras separadas por espacios da lo mismo que plegar el texto entero:
+    ninguna marca combinante es espacio ni carácter de palabra.
+    """
+    texto = (texto or "").lower()
+    if texto.isascii():
+        return _RE_TOKEN.findall(texto)
+    return _RE_TOKEN.findall(" ".join(map(_plegar_palabra, texto.split())))
+
+
+def firma_nota(item):
+    """Digest (blake2b, hex) de título + texto para validar el índice persistido."""
+    firma = getattr(item, "firma", None)
+    if firma is not None:
+        # nota perezosa: la firma viene del índice y no obliga a leer el cuerpo
+        return firma
+    firma = hash_texto(item.get("nombre", "") + "\0" + item.get("text", "")).hex()
+    if isinstance(item, NotaPerezosa):
+        item.firma = firma
+    return firma
+
+
+class IndiceTexto:
+    """Índice invertido token -> claves de nota, con búsqueda por prefijo.
+
+    El vocabulario ordenado (para resolver prefijos con bisect) se rehace de una vez
+    con `sorted()` en la primera búsqueda tras altas o bajas de tokens: mantenerlo con
+    insort costaba O(V) por palabra nueva, O(V²) al indexar la colección. La copia
+    en disco guarda por id de nota su firma y sus tokens; al arrancar solo se tokenizan
+    las notas cuya firma no coincide (nuevas o modificadas).
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.tokens_doc = {}
+        self.vocab = []
+        self.vocab_sucio = False
+        self.cache = {}
+        self.sucio = False
+
+    def agregar(self, clave, item):
+        f = firma_nota(item)
+        previo = self.cache.get(clave)
+        if previo is not None and previo[0] == f:
+            tokens = previo[1]
+        else:
+            tokens = frozenset(tokenizar(item.get("nombre", "")) + tokenizar(item.get("text", "")))
+            self.cache[clave] = (f, tokens)
+            self.sucio = True
+        self.tokens_doc[clave] = (f, tokens)
+        for t in tokens:
+            claves = self.postings.get(t)
+            if claves is None:
+                claves = self.postings[t] = set()
+                self.vocab_sucio = True
+            claves.add(clave)
+
+    def quitar(self, clave):
+        previo = self.tokens_doc.pop(clave, None)
+        if previo is None:
+            return
+        f, tokens = previo
+        for t in tokens:
+            claves = self.postings.get(t)
+            if claves is None:
+                continue
+            claves.discard(clave)
+            if not claves:
+                del self.postings[t]
+                self.vocab_sucio = True
+        self.cache.pop(clave, None)
+        self.sucio = True
+
+    def _prefijo(self, prefijo):
+        if self.vocab_sucio:
+            self.vocab = sorted(self.postings)
+            self.vocab_sucio = False
+        claves = set()
+        i = bisect.bisect_left(self.vocab, prefijo)
+        while i < len(self.vocab) and self.vocab[i].startswith(prefijo):
+            claves |= self.postings[self.vocab[i]]
+            i += 1
+        return claves
+
+    def buscar(self, consulta):
+        """Claves de las notas que contienen todos los términos (cada uno como prefijo)."""
+        resultado = None
+        # los términos largos suelen ser más selectivos: empezar por ellos
+        for termino in sorted(set(tokenizar(consulta)), key=len, reverse=True):
+            claves = self._prefijo(termino)
+            resultado = claves if resultado is None else resultado & claves
+            if not resultado:
+                return set()
+        return resultado if resultado is not None else set()
+
+    @metricas.medir("disco.indice_cargar", lambda a, r: os.path.getsize(DATA_INDEX) if os.path.exists(DATA_INDEX) else 0)
+    def cargar(self, path=DATA_INDEX):
+        """Lee la caché de tokens por id; si falta, está corrupta o es de otra versión, se reconstruye al indexar."""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                guardado = json.load(f)
+            if guardado.get("version") != 2:
+                return
+            self.cache = {k: (f, frozenset(tokens)) for k, (f, tokens) in guardado.get("docs", {}).items()}
+        except Exception:
+            self.cache = {}
+
+    @metricas.medir("disco.indice_guardar")
+    def guardar(self, path=DATA_INDEX):
+        if not self.sucio:
+            return
+        docs = {clave: [f, sorted(tokens)] for clave, (f, tokens) in self.tokens_doc.items()}
+        escribir_json(path, {"version": 2, "docs": docs})
+        self.sucio = False
+
+
+# -------------------------
+# BÚSQUEDA DIFUSA: ÍNDICE DE TRIGRAMAS
+# -------------------------
+def trigramas(texto):
+    """Trigramas de cada palabra plegada, con relleno al estilo pg_trgm ("  ca", " ca", ...)."""
+    tris = set()
+    for palabra in tokenizar(texto):
+        p = "  " + palabra + " "
+        for i in range(len(p) - 2):
+            tris.add(p[i:i + 3])
+    return tris
+
+
+class IndiceTrigramas:
+    """Índice de trigramas para búsqueda tolerante a errores, con ranking.
+
+    Título y cuerpo se indexan por separado para que un acierto en el título pese
+    PESO_TITULO veces más. Altas y bajas son incrementales.
+    """
+
+    def __init__(self):
+        self.titulo = {}
+        self.cuerpo = {}
+        self.tris_doc = {}
+        self.listo = False
+
+    def construir(self, items):
+        """Indexa todo de una vez; se llama en la primera búsqueda difusa."""
+        self.listo = True
+        for item in items:
+            self.agregar(item["id"], item)
+
+    @staticmethod
+    def _poner(postings, tris, clave):
+        for t in tris:
+            postings.setdefault(t, set()).add(clave)
+
+    @staticmethod
+    def _sacar(postings, tris, clave):
+        for t in tris:
+            claves = postings.get(t)
+            if claves is not None:
+                claves.discard(clave)
+                if not claves:
+                    del postings[t]
+
+    def agregar(self, clave, item):
+        if not self.listo:
+            # aún sin construir: `construir` la recogerá de las notas
+            return
+        tris_t = trigramas(item.get("nombre", ""))
+        tris_c = trigramas(item.get("text", ""))
+        self.tris_doc[clave] = (tris_t, tris_c)
+        self._poner(self.titulo, tris_t, clave)
+        self._poner(self.cuerpo, tris_c, clave)
+
+    def quitar(self, clave):
+        previo = self.tris_doc.pop(clave, None)
+        if previo is not None:
+            self._sacar(self.titulo, previo[0], clave)
+            self._sacar(self.cuerpo, previo[1], clave)
+
+    def buscar(self, consulta, limite=BUSQUEDA_TOP_N, umbral=BUSQUEDA_UMBRAL):
+        """Devuelve las `limite` claves más relevantes, de mayor a menor puntuación."""
+        q = trigramas(consulta)
+        if not q:
+            return []
+        hits_t, hits_c = {}, {}
+        for t in q:
+            for clave in self.titulo.get(t, ()):
+                hits_t[clave] = hits_t.get(clave, 0) + 1
+            for clave in self.cuerpo.get(t, ()):
+                hits_c[clave] = hits_c.get(clave, 0) + 1
+        minimo = umbral * len(q)
+        puntuados = []
+        for clave in hits_t.keys() | hits_c.keys():
+            ht, hc = hits_t.get(clave, 0), hits_c.get(clave, 0)
+            if max(ht, hc) >= minimo:
+                puntuados.append((PESO_TITULO * ht + hc, clave))
+        return [clave for _, clave in heapq.nlargest(limite, puntuados, key=lambda p: p[0])]
+
+
+# -------------------------
+# ORDEN DEL GRID: ÍNDICES SECUNDARIOS
+# -------------------------
+# Criterio -> clave de orden de una nota; "insercion" es el orden propio de `Notas`.
+# Las notas sin fechas (anteriores a los timestamps) quedan como las más antiguas.
+ORDENES = {
+    "insercion": None,
+    "modificado": lambda item: -(item.get("modificado") or 0),
+    "nombre": lambda item: plegar(item.get("nombre", "")),
+    "color": lambda item: (item.get("color") or "").upper(),
+}
+
+
+class IndiceOrden:
+    """Una lista ordenada de (clave, id) por criterio de ORDENES.
+
+    Cada alta, cambio o baja la mantiene con bisect, sin reordenar nada; la carga por
+    lotes añade al final y ordena una vez por lote. Así el grid cambia de orden
+    cortando la lista (ver `vista`) en vez de ordenar todas las notas en cada render.
+    """
+
+    def __init__(self):
+        self.listas = {criterio: [] for criterio, clave in ORDENES.items() if clave}
+        self.claves = {}
+
+    def _claves(self, nota_id, item):
+        return {criterio: (ORDENES[criterio](item), nota_id) for criterio in self.listas}
+
+    def agregar(self, nota_id, item):
+        self.quitar(nota_id)
+        if item.get("Type", 1) != 1:
+            return
+        claves = self.claves[nota_id] = self._claves(nota_id, item)
+        for criterio, lista in self.listas.items():
+            bisect.insort(lista, claves[criterio])
+
+    def agregar_lote(self, items):
+        nuevas = []
+        for item in items:
+            self.quitar(item["id"])
+            if item.get("Type", 1) == 1:
+                nuevas.append(self._claves(item["id"], item))
+                self.claves[item["id"]] = nuevas[-1]
+        for criterio, lista in self.listas.items():
+            lista.extend(claves[criterio] for claves in nuevas)
+            lista.sort()
+
+    def quitar(self, nota_id):
+        claves = self.claves.pop(nota_id, None)
+        if claves is None:
+            return
+        for criterio, clave in claves.items():
+            lista = self.listas[criterio]
+            i = bisect.bisect_left(lista, clave)
+            if i < len(lista) and lista[i] == clave:
+                del lista[i]
+
+    def ordenar(self, criterio, ids):
+        """Ordena un subconjunto (p. ej. el resultado de una búsqueda): O(k log k)."""
+        return sorted((i for i in ids if i in self.claves), key=lambda i: self.claves[i][criterio])
+
+    def vista(self, criterio, notas):
+        return VistaOrden(self.listas[criterio], notas)
+
+
+class VistaOrden:
+    """Las notas en el orden de una lista de IndiceOrden, resueltas solo al cortarla.
+
+    `len()` es O(1) y `vista[inicio:fin]` busca solo esas notas en `notas`.
+    """
+
+    def __init__(self, claves, notas):
+        self._claves = claves
+        self._notas = notas
+
+    def __len__(self):
+        return len(self._claves)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [item for item in map(self._notas.get, (nota_id for _, nota_id in self._claves[i])) if item is not None]
+        return self._notas.get(self._claves[i][1])
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+# -------------------------
+# PREVIEW MARKDOWN (caché por hash de contenido)
+# -------------------------
+def hash_texto(texto):
+    return hashlib.blake2b((texto or "").encode("utf-8"), digest_size=16).digest()
+
+
+def dividir_bloques(texto):
+    """Parte un Markdown en bloques por líneas en blanco, sin cortar bloques de código ```."""
+    bloques, actual, en_codigo = [], [], False
+    for linea in texto.split("\n"):
+        if linea.lstrip().startswith("```"):
+            en_codigo = not en_codigo
+        if not linea.strip() and not en_codigo:
+            if actual:
+                bloques.append("\n".join(actual))
+                actual = []
+            continue
+        actual.append(linea)
+    if actual:
+        bloques.append("\n".join(actual))
+    return bloques
+
+
+class PreviewMarkdown:
+    """Vista previa de una nota que solo reenvía al cliente lo que cambió.
+
+    Si el hash del texto coincide con lo ya mostrado no se toca nada. Los documentos
+    largos se muestran como una lista de bloques; cada bloque conserva su control
+    mientras su contenido no cambie, así solo se re-renderizan los bloques editados.
+    """
+
+    def __init__(self):
+        self.hash = None
+        self.simple = ft.Markdown(value="", selectable=True, expand=True)
+        self.lista = ft.ListView(expand=True, spacing=10)
+        self.por_bloque = {}
+        self.actual = self.simple
+
+    def mostrar(self, texto):
+        texto = texto or ""
+        h = hash_texto(texto)
+        if h == self.hash:
+            return self.actual
+        self.hash = h
+        if len(texto) < PREVIEW_BLOQUES_MIN:
+            self.simple.value = texto
+            self.actual = self.simple
+            return self.actual
+
+        anteriores, nuevos, controles = self.por_bloque, {}, []
+        for bloque in dividir_bloques(texto):
+            hb = hash_texto(bloque)
+            libres = anteriores.get(hb)
+            md = libres.pop() if libres else ft.Markdown(value=bloque, selectable=True)
+            nuevos.setdefault(hb, []).append(md)
+            controles.append(md)
+        self.por_bloque = nuevos
+        self.lista.controls = controles
+        self.actual = self.lista
+        return self.actual
+
+
+# -------------------------
+# TIENDA COMPARTIDA (sesiones web)
+# -------------------------
+class TiendaCompartida:
+    """Notas e índices de búsqueda compartidos por todas las sesiones del proceso.
+
+    Con `ft.app(..., view=ft.AppView.WEB_BROWSER)` cada pestaña ejecuta su propio
+    `main(page)`; todas usan esta tienda, así hay una sola copia de las notas por
+    proceso. Las escrituras van en serie con `escritura()` (`bloqueo_archivo`), que no
+    toma `lock`: la persistencia espera al disco y las lecturas no deben esperarla.
+    `lock` protege solo los índices en memoria: quien escribe lo toma tras persistir
+    para actualizarlos y render_lista para consultarlos. `data` se recorre sin
+    cerrojo (ver Notas.vista).
+    Cada sesión avisa a las demás por `page.pubsub` (tema TEMA_NOTAS) tras un cambio.
+    """
+
+    def __init__(self):
+        self.clave = None
+        self.data = Notas()
+        self.indice = IndiceTexto()
+        self.trigramas = IndiceTrigramas()
+        self.orden = IndiceOrden()
+        self.lock = threading.RLock()
+        self.carga_completa = threading.Event()
+
+    def abrir(self, modo, compresion=""):
+        """Configura el almacén la primera vez; devuelve True si quien llama debe cargar."""
+        with self.lock:
+            if self.clave == (modo, compresion):
+                return False
+            uso_almacen.compartir()
+            configurar_almacen(modo, compresion)
+            self.clave = (modo, compresion)
+            self.data = Notas()
+            self.indice = IndiceTexto()
+            self.indice.cargar()
+            self.trigramas = IndiceTrigramas()
+            self.orden = IndiceOrden()
+            self.carga_completa = threading.Event()
+            return True
+
+    @contextlib.contextmanager
+    def escritura(self):
+        with bloqueo_archivo:
+            yield self
+
+
+tienda = TiendaCompartida()
 
 
 # -------------------------
@@ -157,6 +2495,8 @@ def guardar_datos(lista):
 def main(page: ft.Page):
     # Cargar settings al inicio (una sola vez)
     settings = load_settings()
+    if settings.get("metricas"):
+        metricas.activar()
     ImportantVars.bradius = float(settings.get("bradius", 20.0))
 
     # Ajustar tamaños de fuente iniciales
@@ -179,135 +2519,406 @@ def main(page: ft.Page):
     page.bgcolor = THEME["bg"]
     page.padding = 12
 
+    # Un único page.update() por frame; los handlers con varios pasos usan pagina.batch().
+    # `lock_sesion` serializa render y envío de esta sesión; a la tienda compartida solo
+    # se le pide la consulta, con `lock_datos` y siempre dentro de `lock_sesion`
+    lock_sesion = threading.RLock()
+    pagina = ActualizadorPagina(page, lock_sesion)
+
+    # Controles cuyo estilo depende del tema/radio: se registran para reestilizarlos en vivo
+    tematizados = []
+
+    def tema(control, **props):
+        """Aplica y registra propiedades de estilo: `color="text"`, `border="a1"`, `border_radius="radio"`."""
+        if len(tematizados) > 256:
+            # las vistas reconstruidas dejan referencias muertas
+            tematizados[:] = [t for t in tematizados if t[0]() is not None]
+        tematizados.append((weakref.ref(control), props))
+        aplicar_tema(control, props)
+        return control
+
+    def aplicar_tema(control, props):
+        for attr, clave in props.items():
+            if clave == "radio":
+                valor = ImportantVars.bradius
+            elif attr == "border":
+                valor = ft.border.all(1, THEME[clave])
+            else:
+                valor = THEME[clave]
+            setattr(control, attr, valor)
+
+    def reestilizar():
+        """Parchea colores, radios y tamaños de lo ya construido y envía un único update."""
+        page.bgcolor = THEME["bg"]
+        vivos = []
+        for ref, props in tematizados:
+            control = ref()
+            if control is not None:
+                aplicar_tema(control, props)
+                vivos.append((ref, props))
+        tematizados[:] = vivos
+        # el formulario usa colores fijos: se reconstruye al volver a abrirlo; el resto
+        # (inicio y ajustes) ya quedó parcheado y sigue montado
+        invalidar_vista("form")
+        render_lista()
+
     # Elementos reusables
-    # GRID donde se muestran las notas (solo Type == 1)
-    lista_contenedores = ft.GridView(
+    # GRID donde se muestran las notas (solo Type == 1): los tiles de la ventana van en
+    # `lista_contenedores` y lo que queda fuera, arriba y abajo, son dos espaciadores
+    # con la altura de esas filas (ver render_lista)
+    espacio_antes = ft.Container(height=0)
+    espacio_despues = ft.Container(height=0)
+    lista_contenedores = ft.ResponsiveRow(spacing=GRID_ESPACIO, run_spacing=GRID_ESPACIO)
+    grid_scroll = ft.Column(
         expand=True,
-        runs_count=0,
-        max_extent=220,
+        scroll=ft.ScrollMode.AUTO,
+        spacing=0,
         animate_scale=ft.Animation(600, ft.AnimationCurve.BOUNCE_OUT),
-        spacing=10,
-        run_spacing=10,
+        controls=[espacio_antes, lista_contenedores, espacio_despues],
     )
 
-    # Cargar datos
-    data = cargar_datos()
+    # Cargar datos: notas e índices viven en la tienda compartida del proceso; la primera
+    # sesión los carga por lotes desde un hilo (ver cargar_en_segundo_plano al final) y
+    # las demás reutilizan lo cargado. `lock_datos` serializa los lotes con los handlers
+    # que recorren los índices (nunca se llama a render_lista con él tomado: el orden
+    # es lock_sesion -> lock_datos); altas y bajas esperan a `carga_completa`.
+    debe_cargar = tienda.abrir(settings.get("storage", "json"), settings.get("compresion", ""))
+    lock_datos = tienda.lock
+    carga_completa = tienda.carga_completa
+
+    # Índices de búsqueda (las claves son los ids de nota); se llenan con cada lote
+    indice = tienda.indice
+    # el de trigramas se construye en la primera búsqueda difusa (lee todos los cuerpos)
+    trigramas_idx = tienda.trigramas
 
     # -------------------------
     # CREAR CONTENEDOR (NOTA)
     # -------------------------
-    def crear_contenedor_nota(index: int, item: dict) -> ft.Container:
-        """Construye y devuelve un ft.Container para una nota (Type == 1)."""
-        # Botón de eliminar (aparece en la parte superior del contenedor)
+    def crear_contenedor_nota(item: dict) -> ft.Container:
+        """Construye y devuelve un ft.Container para una nota (Type == 1).
+
+        Los handlers leen la nota de `cont.data`, así el tile puede reciclarse
+        para otra nota con `vincular_tile` sin reconstruirlo. Los objetos de estilo
+        salen de `estilo_tile` y se comparten entre todos los tiles.
+        """
+        est = estado_grid["estilo"]
+        colores = est.colores
+        delete_switch = ft.Switch(
+            thumb_icon=ft.Icons.CHECK,
+            expand=True,
+            inactive_track_color=colores["a2"],
+            active_color="red",
+            active_track_color="red",
+            on_change=lambda e: alternar_seleccion(cont.data["item"]["id"], delete_switch.value),
+        )
+        # Marca de selección (aparece en la parte superior del contenedor en modo selección)
         delete_button = ft.Container(
-            bgcolor=THEME["a1"],
-            scale=0,
-            height=0,
-            animate_size=ft.Animation(600, ft.AnimationCurve.BOUNCE_OUT),
-            animate_scale=ft.Animation(600, ft.AnimationCurve.BOUNCE_IN_OUT),
-            border_radius=ImportantVars.bradius,
-            border=ft.border.all(1, THEME["a2"]),
-            content=ft.Row(
-                controls=[
-                    ft.Switch(
-                        thumb_icon=ft.Icons.DELETE,
-                        expand=True,
-                        inactive_track_color=THEME["a2"],
-                        active_color="red",
-                        active_track_color="red",
-                        on_change=lambda e, idx=index: eliminar(idx),
-                    )
-                ],
-                spacing=0,
-            ),
+            bgcolor=colores["a1"],
+            scale=1 if estado_grid["seleccionando"] else 0,
+            height=None if estado_grid["seleccionando"] else 0,
+            animate_size=est.anim_rebote,
+            animate_scale=est.anim_rebote_io,
+            border_radius=est.radio,
+            border=est.borde,
+            content=ft.Row(controls=[delete_switch], spacing=0),
         )
 
-        # Column con preview (si está activada la previsualización)
-        if settings.get("preview", True):
-            content_column = ft.Column(
-                controls=[
-                    delete_button,
-                    ft.Container(
-                        margin=ft.margin.only(bottom=45),
-                        content=ft.Column(
-                            controls=[
-                                ft.Text(item.get("nombre", "Sin título"), weight="bold", size=ImportantVars.ctitle, color=THEME["text"]),
-                                ft.Text(item.get("text", ""), weight="bold", size=ImportantVars.ctext, color=THEME["text"], expand=True),
-                            ]
-                        ),
-                    ),
-                ],
-                alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
-            )
-        else:
-            content_column = ft.Column(
-                controls=[
-                    delete_button,
-                    ft.Container(
-                        margin=ft.margin.only(bottom=45),
-                        content=ft.Column(
-                            controls=[
-                                ft.Text(item.get("nombre", "Sin título"), weight="bold", size=ImportantVars.ctitle, color=THEME["text"]),
-                                ft.Text("", weight="bold", size=ImportantVars.ctext, color=THEME["text"], expand=True),
-                            ]
-                        ),
-                    ),
-                ],
-                alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
-            )
+        titulo = ft.Text("", weight="bold", size=est.ctitle, color=colores["text"])
+        # Extracto de la nota (vacío si la previsualización está desactivada)
+        cuerpo = ft.Text("", weight="bold", size=est.ctext, color=colores["text"], expand=True)
+
+        content_column = ft.Column(
+            controls=[
+                delete_button,
+                ft.Container(
+                    margin=est.margen_texto,
+                    content=ft.Column(controls=[titulo, cuerpo]),
+                ),
+            ],
+            alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
+        )
 
         cont = ft.Container(
-            on_click=lambda e, idx=index: ir_a_editar(e, idx),
-            gradient=ft.LinearGradient(begin=ft.alignment.top_center, end=ft.alignment.bottom_center, colors=[THEME["bg"], THEME["bg2"]]),
-            height=50,
-            width=200,
-            border_radius=ImportantVars.bradius,
+            on_click=lambda e: ir_a_editar(e, cont.data["item"]["id"]),
+            gradient=est.gradiente,
+            height=GRID_TILE,
+            border_radius=est.radio,
             padding=10,
             scale=1,
             on_animation_end=lambda e: content_column.update(),
-            animate_scale=ft.Animation(600, ft.AnimationCurve.BOUNCE_OUT),
-            opacity=0,
-            animate_size=ft.Animation(600, ft.AnimationCurve.BOUNCE_IN_OUT),
-            border=ft.border.all(1, THEME["a2"]),
+            animate_scale=est.anim_rebote,
+            opacity=1,
+            offset=est.offset,
+            animate_size=est.anim_rebote_io,
+            border=est.borde,
             content=content_column,
         )
 
-        cont.opacity = 1
-        cont.offset = ft.Offset(0, 0)
+        cont.data = {
+            "item": None,
+            "estilo": est,
+            "preview": None,
+            "titulo": titulo,
+            "cuerpo": cuerpo,
+            "switch": delete_switch,
+            "delete": delete_button,
+        }
+        vincular_tile(cont, item)
         return cont
 
+    def vincular_tile(cont: ft.Container, item: dict):
+        """Asocia un tile (nuevo o reciclado) a una nota, tocando solo lo que cambia."""
+        d = cont.data
+        if d["estilo"] is not estado_grid["estilo"]:
+            aplicar_estilo_tile(cont, estado_grid["estilo"])
+        preview = estado_grid["preview"]
+        nueva = d["item"] is not item
+        if nueva or d["preview"] != preview:
+            d["cuerpo"].value = item.get("snippet", "") if preview else ""
+            d["preview"] = preview
+        if not nueva:
+            return
+        d["item"] = item
+        d["titulo"].value = item.get("nombre", "Sin título")
+        d["switch"].value = item["id"] in seleccion
+        d["delete"].scale = 1 if estado_grid["seleccionando"] else 0
+        d["delete"].height = None if estado_grid["seleccionando"] else 0
+        cont.key = item["id"]
+
+    def aplicar_estilo_tile(cont: ft.Container, est: EstiloTile):
+        """Cambia solo las propiedades de estilo de un tile existente (tema, radio, fuente)."""
+        d = cont.data
+        colores = est.colores
+        cont.gradient = est.gradiente
+        cont.border = est.borde
+        cont.border_radius = est.radio
+        d["delete"].bgcolor = colores["a1"]
+        d["delete"].border = est.borde
+        d["delete"].border_radius = est.radio
+        d["switch"].inactive_track_color = colores["a2"]
+        d["titulo"].size = est.ctitle
+        d["titulo"].color = colores["text"]
+        d["cuerpo"].size = est.ctext
+        d["cuerpo"].color = colores["text"]
+        d["estilo"] = est
+
     # -------------------------
     # RENDERIZAR LISTA (solo notas)
     # -------------------------
+    # Caché de tiles materializados por clave de nota. Un tile se reutiliza si su nota
+    # es el mismo objeto (si cambió el estilo se parchea en sitio); los que salen de la
+    # ventana van a `pool_tiles` para reciclarse.
+    # Solo se materializan las notas de la ventana [inicio, fin), alineada a filas; las
+    # filas anteriores y posteriores son un solo espaciador cada una, con su altura.
+    tiles = {}
+    pool_tiles = []
+    seleccion = set()  # ids marcados en modo selección (ver SELECCIÓN MÚLTIPLE)
+    estado_grid = {"columnas": 1, "seleccionando": False, "estilo": None, "preview": None, "inicio": 0, "fin": GRID_VENTANA, "visibles": [], "consulta": ""}
+
+    def columnas_grid():
+        """Tiles por fila según el ancho de la página; divisor de 12 para `col`."""
+        ancho = page.width or 800
+        return max([c for c in (1, 2, 3, 4, 6) if c * (GRID_TILE + GRID_ESPACIO) <= ancho] or [1])
+
+    def estilo_actual():
+        return estilo_tile(tuple(THEME[k] for k in THEME_KEYS), ImportantVars.bradius, ImportantVars.ctitle, ImportantVars.ctext)
+
+    @metricas.medir("ui.render_lista")
+    @sincronizado(lock_sesion)
     def render_lista():
-        lista_contenedores.controls.clear()
-        for idx, item in enumerate(data):
-            # Solo renderizamos items de Type == 1 (notas). Ignoramos cualquier otro tipo.
-            if item.get("Type", 1) == 1:
-                lista_contenedores.controls.append(crear_contenedor_nota(idx, item))
-        page.update()
+        estado_grid["estilo"] = estilo_actual()
+        estado_grid["preview"] = settings.get("preview", True)
+
+        # Solo renderizamos items de Type == 1 (notas). Ignoramos cualquier otro tipo.
+        consulta = estado_grid["consulta"].strip()
+        orden = settings.get("orden", "insercion")
+        cols = estado_grid["columnas"] = columnas_grid()
+        # de lo compartido solo se toma, con `lock_datos`, la consulta y la ventana;
+        # los tiles se construyen y envían con el cerrojo de la sesión
+        with lock_datos:
+            if consulta and settings.get("fuzzy", False):
+                # modo difuso: solo las mejores coincidencias, en orden de relevancia
+                if not trigramas_idx.listo:
+                    trigramas_idx.construir(tienda.data)
+                visibles = [tienda.data.get(clave) for clave in trigramas_idx.buscar(consulta)]
+                visibles = [item for item in visibles if item is not None and item.get("Type", 1) == 1]
+            elif orden in tienda.orden.listas:
+                # orden secundario: sin consulta solo se corta la ventana; con ella se ordenan los resultados
+                if consulta:
+                    visibles = [tienda.data.get(nota_id) for nota_id in tienda.orden.ordenar(orden, indice.buscar(consulta))]
+                    # los índices se ponen al día justo después de persistir: puede faltar alguna
+                    visibles = [item for item in visibles if item is not None]
+                else:
+                    visibles = tienda.orden.vista(orden, tienda.data)
+            else:
+                filtro = indice.buscar(consulta) if consulta else None
+                visibles = [
+                    item
+                    for item in tienda.data
+                    if item.get("Type", 1) == 1 and (filtro is None or item["id"] in filtro)
+                ]
+            total = len(visibles)
+            inicio = min(estado_grid["inicio"], max(0, total - GRID_VENTANA)) // cols * cols
+            fin = min(total, -(-max(estado_grid["fin"], inicio + GRID_VENTANA) // cols) * cols)
+            ventana = visibles[inicio:fin]
+        estado_grid["visibles"] = visibles
+        estado_grid["inicio"], estado_grid["fin"] = inicio, fin
+
+        alto_fila = GRID_TILE + GRID_ESPACIO
+        espacio_antes.height = inicio // cols * alto_fila
+        espacio_despues.height = -(-(total - fin) // cols) * alto_fila
+
+        controles = []
+        nuevos = {}
+        for item in ventana:
+            cont = tiles.pop(item["id"], None)
+            if cont is None or cont.data["item"] is not item:
+                if cont is not None:
+                    pool_tiles.append(cont)
+                cont = pool_tiles.pop() if pool_tiles else crear_contenedor_nota(item)
+            vincular_tile(cont, item)
+            if cont.col != 12 // cols:
+                cont.col = 12 // cols
+            nuevos[item["id"]] = cont
+            controles.append(cont)
+
+        # lo que quedó fuera de la ventana se recicla
+        pool_tiles.extend(tiles.values())
+        del pool_tiles[GRID_POOL_MAX:]
+        tiles.clear()
+        tiles.update(nuevos)
+
+        actuales = lista_contenedores.controls
+        if len(actuales) != len(controles) or any(a is not b for a, b in zip(actuales, controles)):
+            lista_contenedores.controls = controles
+        pagina.marcar()
+
+    @metricas.medir("ui.scroll_grid")
+    def scroll_grid(e: ft.OnScrollEvent):
+        """Desplaza la ventana materializada según la posición del scroll (por páginas)."""
+        total = len(estado_grid["visibles"])
+        if total <= GRID_VENTANA:
+            return
+        cols = estado_grid["columnas"]
+        alto_fila = GRID_TILE + GRID_ESPACIO
+        primera = int((e.pixels or 0) // alto_fila) * cols
+        en_pantalla = max(1, -(-int(e.viewport_dimension or 0) // alto_fila)) * cols
+        inicio = max(0, (primera - GRID_MARGEN) // GRID_PAGINA * GRID_PAGINA)
+        fin = -(-(primera + en_pantalla + GRID_MARGEN) // GRID_PAGINA) * GRID_PAGINA
+        fin = min(total, max(fin, inicio + GRID_VENTANA))
+        if (inicio, fin) != (estado_grid["inicio"], estado_grid["fin"]):
+            estado_grid["inicio"], estado_grid["fin"] = inicio, fin
+            render_lista()
+
+    grid_scroll.on_scroll = scroll_grid
+    grid_scroll.on_scroll_interval = 100
+
+    def al_redimensionar(e):
+        # otro número de columnas cambia la altura de las filas fuera de la ventana
+        if columnas_grid() != estado_grid["columnas"]:
+            render_lista()
+
+    page.on_resized = al_redimensionar
 
     render_lista()
 
     # -------------------------
-    # ELIMINAR ITEM
+    # AVISOS ENTRE SESIONES
+    # -------------------------
+    # Notas e índices ya son compartidos: a las demás sesiones solo hay que pedirles
+    # que redibujen su ventana del grid (render_lista solo toca los tiles cambiados).
+    def avisar_sesiones():
+        page.pubsub.send_others_on_topic(TEMA_NOTAS, None)
+
+    def al_cambiar_notas(topic, mensaje):
+        if carga_completa.is_set():
+            progreso_carga.visible = False
+        render_lista()
+
+    page.pubsub.subscribe_topic(TEMA_NOTAS, al_cambiar_notas)
+
+    # una escritura diferida que falla (disco lleno, permisos) se reintenta sola, pero
+    # quien está editando tiene que saber que su cambio aún no está en disco
+    def al_fallar_escritura(clave, ex):
+        with lock_sesion:
+            page.open(ft.SnackBar(ft.Text(f"No se pudo guardar {clave} ({ex}); se reintentará")))
+
+    escrituras.al_fallar.append(al_fallar_escritura)
+
+    # -------------------------
+    # SELECCIÓN MÚLTIPLE
     # -------------------------
-    def eliminar(idx: int):
-        if 0 <= idx < len(data):
-            data.pop(idx)
-            guardar_datos(data)
+    # Los tiles marcan/desmarcan ids en `seleccion`; borrar, recolorear y exportar se
+    # aplican a toda la selección como un único lote (una escritura y un solo envío).
+
+    def alternar_seleccion(nota_id, marcada):
+        if marcada:
+            seleccion.add(nota_id)
+        else:
+            seleccion.discard(nota_id)
+        contador_seleccion.value = f"{len(seleccion)} seleccionadas"
+        pagina.marcar()
+
+    def seleccionar_todo(e):
+        seleccion.update(item["id"] for item in estado_grid["visibles"])
+        for cont in tiles.values():
+            cont.data["switch"].value = True
+        alternar_seleccion(None, False)
+
+    def salir_de_seleccion():
+        if estado_grid["seleccionando"]:
+            reapariton_of_delete_button(None)
+
+    def aplicar_seleccion(poner=(), quitar=()):
+        """Persiste `poner`/`quitar` con un solo `nota_lote` y redibuja una vez."""
+        # no persistir sobre una colección a medio cargar
+        carga_completa.wait()
+        with pagina.batch(), tienda.escritura():
+            # el disco va sin `lock_datos`: las demás sesiones siguen pintando mientras
+            nota_lote(tienda.data, list(poner), list(quitar))
+            with lock_datos:
+                for nota_id in quitar:
+                    indice.quitar(nota_id)
+                    trigramas_idx.quitar(nota_id)
+                    tienda.orden.quitar(nota_id)
+                for item in poner:
+                    tienda.orden.agregar(item["id"], item)
+            salir_de_seleccion()
             render_lista()
-            page.update()
+        avisar_sesiones()
+
+    @metricas.medir("ui.eliminar")
+    def eliminar_seleccion(e):
+        aplicar_seleccion(quitar=list(seleccion))
+
+    @metricas.medir("ui.recolorear")
+    def recolorear_seleccion(color, color2):
+        items = [tienda.data.get(nota_id) for nota_id in seleccion]
+        aplicar_seleccion(poner=[nota_con(item, color=color, color2=color2) for item in items if item is not None])
+
+    @metricas.medir("ui.exportar")
+    def exportar_seleccion(e):
+        items = [item for item in map(tienda.data.get, seleccion) if item is not None]
+        path = time.strftime("notas_%Y%m%d_%H%M%S.ndjson")
+        exportar_notas(items, path)
+        with pagina.batch():
+            salir_de_seleccion()
+            page.open(ft.SnackBar(ft.Text(f"{len(items)} notas exportadas a {path}")))
 
     # -------------------------
-    # ANIMACION: mostrar/ocultar botones eliminar
+    # ANIMACION: mostrar/ocultar la selección
     # -------------------------
     def reapariton_of_delete_button(e):
-        for cont in lista_contenedores.controls:
-            aparitionButton = cont.content.controls[0]  # asumimos que el primer control es el DeleteButton
-            aparitionButton.scale = 1 if aparitionButton.scale == 0 else 0
-            aparitionButton.height = None if aparitionButton.height == 0 else 0
-        page.update()
+        estado_grid["seleccionando"] = not estado_grid["seleccionando"]
+        seleccion.clear()
+        for cont in tiles.values():
+            aparitionButton = cont.data["delete"]
+            aparitionButton.scale = 1 if estado_grid["seleccionando"] else 0
+            aparitionButton.height = None if estado_grid["seleccionando"] else 0
+            cont.data["switch"].value = False
+        contador_seleccion.value = "0 seleccionadas"
+        barra_seleccion.visible = estado_grid["seleccionando"]
+        pagina.marcar()
 
     # -------------------------
     # NAVEGACION BASICA
@@ -322,11 +2933,11 @@ def main(page: ft.Page):
     def volver_a_inicio(e):
         page.go("/")
         # Si el SearchBar está visible, ocultarlo
-        page.update()
+        pagina.marcar()
 
 
-    def ir_a_editar(e, index: int):
-        page.go(f"/edit/{index}")
+    def ir_a_editar(e, nota_id: str):
+        page.go(f"/edit/{nota_id}")
 
 
     def go_to_settings(e):
@@ -337,22 +2948,39 @@ def main(page: ft.Page):
     # UI SUPERIOR
     # -------------------------
     tra = ft.Container(
-        bgcolor=THEME["bg2"],
         animate_size=ft.Animation(600, ft.AnimationCurve.BOUNCE_OUT),
         height=35,
         width=50,
         padding=ft.padding.only(left=12),
         on_click=lambda e: chage_tra(e),
-        border_radius=ImportantVars.bradius,
         content=ft.Row(
             alignment=ft.alignment.center,
             controls=[
-                ft.Icon(ft.Icons.MENU, color=THEME["text"]),
-                ft.IconButton(icon=ft.Icons.SETTINGS_OUTLINED, on_click=lambda e: go_to_settings(e), icon_color=THEME["text"]),
+                tema(ft.Icon(ft.Icons.MENU), color="text"),
+                tema(ft.IconButton(icon=ft.Icons.SEARCH, on_click=lambda e: change_seek(e)), icon_color="text"),
+                tema(
+                    ft.PopupMenuButton(
+                        icon=ft.Icons.SORT,
+                        tooltip="Ordenar",
+                        items=[
+                            ft.PopupMenuItem(text=texto, on_click=lambda e, c=criterio: cambiar_orden(c))
+                            for criterio, texto in (
+                                ("insercion", "Orden de creación"),
+                                ("modificado", "Modificadas recientemente"),
+                                ("nombre", "Título"),
+                                ("color", "Color"),
+                            )
+                        ],
+                    ),
+                    icon_color="text",
+                ),
+                tema(ft.IconButton(icon=ft.Icons.SETTINGS_OUTLINED, on_click=lambda e: go_to_settings(e)), icon_color="text"),
             ],
         ),
     )
 
+    tema(tra, bgcolor="bg2", border_radius="radio")
+
     # cambia tamaño del tra (menu)
     def chage_tra(e):
         tra.height = 70 if tra.height == 35 else 35
@@ -368,44 +2996,96 @@ def main(page: ft.Page):
             if tra.shadow is None
             else None
         )
+        pagina.marcar()
 
+    # cambiar el orden del grid: la ventana vuelve al principio
+    @metricas.medir("ui.cambiar_orden")
+    def cambiar_orden(criterio):
+        settings["orden"] = criterio
+        save_settings(settings)
+        estado_grid["inicio"], estado_grid["fin"] = 0, GRID_VENTANA
         render_lista()
 
-        page.update()
-
     # mostrar/ocultar buscador
     def change_seek(e):
-        if seeker.scale == 0:
-            seeker.value = ""
-            # Mostrar buscador
-            seeker.scale = 1
-            seeker.height = 50
-            separation.height = 50
-            note_text.scale = 0
-            seeker.disabled = False
-            page.update()
+        with pagina.batch():
+            if seeker.scale == 0:
+                seeker.value = ""
+                # Mostrar buscador
+                seeker.scale = 1
+                seeker.height = 50
+                separation.height = 50
+                note_text.scale = 0
+                seeker.disabled = False
+            else:
+                # Ocultar buscador
+                seeker.value = ""
+                seeker.scale = 0
+                seeker.height = 0
+                separation.height = 0
+                seeker.disabled = True
+                note_text.scale = 1
+
+                estado_grid["consulta"] = ""
+                render_lista()  # restaurar lista completa
+            pagina.marcar()
+        if seeker.scale == 1:
+            # el campo tiene que estar en el cliente antes de enfocarlo
             seeker.focus()
-        else:
-            # Ocultar buscador
-            seeker.value = ""
-            seeker.scale = 0
-            seeker.height = 0
-            separation.height = 0
-            seeker.disabled = True
-            page.update()
-            note_text.scale = 1
-            
-            render_lista()  # restaurar lista completa
-
-        page.update()
+
+    @metricas.medir("ui.buscar_notas")
+    def buscar_notas(e):
+        estado_grid["consulta"] = seeker.value or ""
+        estado_grid["inicio"] = 0
+        render_lista()
+
+    seeker = ft.TextField(
+        hint_text="Buscar",
+        scale=0,
+        height=0,
+        disabled=True,
+        animate_scale=ft.Animation(600, ft.AnimationCurve.BOUNCE_OUT),
+        animate_size=ft.Animation(600, ft.AnimationCurve.BOUNCE_OUT),
+        on_change=buscar_notas,
+    )
+    tema(seeker, border_radius="radio", border_color="a2", color="text")
 
     note_text = ft.Container(
-        content=ft.Text("Notes", size=30, color=THEME["text"]),
+        content=tema(ft.Text("Notes", size=30), color="text"),
         padding=ft.padding.only(left=11, top=11),
         animate_size=ft.Animation(300, ft.AnimationCurve.EASE_IN_OUT),
         animate_scale=ft.Animation(600, ft.AnimationCurve.BOUNCE_IN_OUT),
     )
 
+    # Barra fina mientras las notas se cargan en segundo plano
+    progreso_carga = tema(ft.ProgressBar(height=2), color="a1", bgcolor="bg2")
+
+    # Acciones sobre la selección múltiple (visible en modo selección, con pulsación larga)
+    contador_seleccion = tema(ft.Text("0 seleccionadas", expand=True), color="text")
+    barra_seleccion = ft.Row(
+        visible=False,
+        controls=[
+            contador_seleccion,
+            tema(ft.IconButton(icon=ft.Icons.SELECT_ALL, tooltip="Seleccionar todo", on_click=seleccionar_todo), icon_color="text"),
+            tema(
+                ft.PopupMenuButton(
+                    icon=ft.Icons.PALETTE_OUTLINED,
+                    tooltip="Recolorear",
+                    items=[
+                        ft.PopupMenuItem(
+                            text=nombre,
+                            on_click=lambda e, p=THEME_PALETTES[nombre]: recolorear_seleccion(p["bg"], p["bg2"]),
+                        )
+                        for nombre in THEMES
+                    ],
+                ),
+                icon_color="text",
+            ),
+            tema(ft.IconButton(icon=ft.Icons.FILE_DOWNLOAD_OUTLINED, tooltip="Exportar", on_click=exportar_seleccion), icon_color="text"),
+            tema(ft.IconButton(icon=ft.Icons.DELETE_OUTLINE, tooltip="Eliminar", on_click=eliminar_seleccion), icon_color="text"),
+        ],
+    )
+
     # -------------------------
     # PICKERS Y SETTINGS UI
     # -------------------------
@@ -418,19 +3098,19 @@ def main(page: ft.Page):
         idx = int(e.data)
         if 0 <= idx < len(THEMES):
             select_fruit_ref.current.value = THEMES[idx]
-        page.update()
+        pagina.marcar()
 
     def handle_picker_fs_change(e):
         idx = int(e.data)
         if 0 <= idx < len(FONT_SIZES):
             select_fonts_ref.current.value = FONT_SIZES[idx]
-        page.update()
+        pagina.marcar()
 
     def handle_picker_rd_change(e):
         idx = int(e.data)
         if 0 <= idx < len(RADIUS_OPTIONS):
             select_radius_ref.current.value = RADIUS_OPTIONS[idx]
-        page.update()
+        pagina.marcar()
 
     cupertino_picker = ft.CupertinoPicker(
         selected_index=0,
@@ -461,30 +3141,30 @@ def main(page: ft.Page):
 
     # Mensajes informativos
     importan_mensaje_theme = ft.Text(
-        "Reinicie la app para aplicar el tema",
+        "Tema aplicado",
         size=12,
-        color=THEME["text"],
         height=0,
         animate_size=ft.Animation(600, ft.AnimationCurve.FAST_OUT_SLOWIN),
     )
+    tema(importan_mensaje_theme, color="text")
 
     importan_mensaje_radius = ft.Text(
-        "Reinicie la app para aplicar el radio del borde",
+        "Radio del borde aplicado",
         size=12,
-        color=THEME["text"],
         height=0,
         animate_size=ft.Animation(600, ft.AnimationCurve.FAST_OUT_SLOWIN),
     )
+    tema(importan_mensaje_radius, color="text")
 
     # Dialogo y funciones aplicar
     themedialog = ft.AlertDialog(
         title=ft.Text("Aplicar Tema"),
-        bgcolor=THEME["a2"],
         actions=[
             ft.ElevatedButton("Aceptar", on_click=lambda e: aplic_theme(e)),
         ],
-        content=ft.Text("El tema ha sido aplicado. Por favor reinicia la aplicación."),
+        content=ft.Text("El tema ha sido aplicado."),
     )
+    tema(themedialog, bgcolor="a2")
 
     def aplic_theme(e):
         # aplicar el tema seleccionado en el picker
@@ -492,25 +3172,25 @@ def main(page: ft.Page):
         change_theme(nuevo)
         page.dialog = None
         page.close_dialog()
-        page.update()
+        pagina.marcar()
 
     # Select buttons (muestran pickers en bottom sheet)
     change_text_button = ft.TextButton(
-        content=ft.Text(value=settings.get("theme", "Pro"), ref=select_fruit_ref, size=20, color=THEME["text"]),
+        content=tema(ft.Text(value=settings.get("theme", "Pro"), ref=select_fruit_ref, size=20), color="text"),
         on_click=lambda e: page.open(
             ft.CupertinoBottomSheet(cupertino_picker, height=216, on_dismiss=lambda ev: change_theme(select_fruit_ref.current.value if select_fruit_ref.current else settings.get("theme")))
         ),
     )
 
     change_size_button = ft.TextButton(
-        content=ft.Text(value=settings.get("font_size", "2"), ref=select_fonts_ref, size=20, color=THEME["text"]),
+        content=tema(ft.Text(value=settings.get("font_size", "2"), ref=select_fonts_ref, size=20), color="text"),
         on_click=lambda e: page.open(
             ft.CupertinoBottomSheet(cupertino_FS_picker, height=216, on_dismiss=lambda ev: change_font_size(select_fonts_ref.current.value if select_fonts_ref.current else settings.get("font_size")))
         ),
     )
 
     change_radius_button = ft.TextButton(
-        content=ft.Text(value=str(settings.get("bradius", 20.0)), ref=select_radius_ref, size=20, color=THEME["text"]),
+        content=tema(ft.Text(value=str(settings.get("bradius", 20.0)), ref=select_radius_ref, size=20), color="text"),
         on_click=lambda e: page.open(
             ft.CupertinoBottomSheet(cupertino_RD_picker, height=216, on_dismiss=lambda ev: change_radius(select_radius_ref.current.value if select_radius_ref.current else str(settings.get("bradius"))))
         ),
@@ -518,23 +3198,24 @@ def main(page: ft.Page):
 
     resetValuebutton = ft.IconButton(
         icon=ft.Icons.SETTINGS_BACKUP_RESTORE,
-        icon_color=THEME["text"],
         height=0,
         scale=0,
         width=0,
         animate_size=ft.Animation(600, ft.AnimationCurve.FAST_OUT_SLOWIN),
         on_click=lambda e: reset_radius(),
     )
+    tema(resetValuebutton, icon_color="text")
 
+    @metricas.medir("ui.reset_radius")
     def reset_radius():
         settings["bradius"] = 20.0
         save_settings(settings)
         ImportantVars.bradius = settings["bradius"]
         importan_mensaje_radius.height = None
         select_radius_ref.current.value = "20" if select_radius_ref.current else "20"
-        render_lista()
-        page.update()
+        reestilizar()
 
+    @metricas.medir("ui.change_radius")
     def change_radius(radius_value):
         try:
             r = float(radius_value)
@@ -544,9 +3225,9 @@ def main(page: ft.Page):
         save_settings(settings)
         ImportantVars.bradius = r
         importan_mensaje_radius.height = None
-        render_lista()
-        page.update()
+        reestilizar()
 
+    @metricas.medir("ui.change_font_size")
     def change_font_size(number):
         if number == "1":
             ImportantVars.ctitle = 15
@@ -561,8 +3242,9 @@ def main(page: ft.Page):
             ImportantVars.ctext = 22
             settings["font_size"] = number
         save_settings(settings)
-        render_lista()
+        reestilizar()
 
+    @metricas.medir("ui.change_theme")
     def change_theme(name):
         # 1. Guardar ajustes
         settings["theme"] = name
@@ -575,10 +3257,10 @@ def main(page: ft.Page):
         # re-asignar THEME (mutamos el objeto que usan los controles en este scope)
         for k in THEME.keys():
             THEME[k] = nonlocal_theme[k]
-        render_lista()
-        page.go(page.route)
-        page.update()
+        # parchear en vivo los controles existentes, sin reconstruir la vista
+        reestilizar()
 
+    @metricas.medir("ui.change_preview")
     def change_preview(e):
         settings["preview"] = True if preview.value else False
         save_settings(settings)
@@ -586,283 +3268,596 @@ def main(page: ft.Page):
     
 
 
+    @metricas.medir("ui.change_fuzzy")
+    def change_fuzzy(e):
+        settings["fuzzy"] = True if fuzzy.value else False
+        save_settings(settings)
+        if estado_grid["consulta"]:
+            render_lista()
+
     preview = ft.Switch(on_change=change_preview, value=settings.get("preview", True))
-    separation = ft.Container(height=0)
+    fuzzy = ft.Switch(on_change=change_fuzzy, value=settings.get("fuzzy", False))
+
+    # Importar / exportar: corre en un hilo y va informando por lotes
+    ruta_transferencia = tema(ft.TextField(hint_text="notas.ndjson o carpeta de .md", expand=True, border_width=0), color="text")
+    progreso_transferencia = tema(ft.ProgressBar(height=2, value=0, visible=False), color="a1", bgcolor="bg2")
+    estado_transferencia = tema(ft.Text("", size=12), color="text")
+
+    def al_progreso_transferencia(hechas, fraccion):
+        progreso_transferencia.value = fraccion
+        estado_transferencia.value = f"{hechas:,} notas"
+        pagina.marcar()
+
+    def confirmar_importacion(lote):
+        with pagina.batch(), tienda.escritura():
+            nota_lote(tienda.data, lote, [], sellar=False)
+            with lock_datos:
+                for item in lote:
+                    indice.quitar(item["id"])
+                    trigramas_idx.quitar(item["id"])
+                    indice.agregar(item["id"], item)
+                    trigramas_idx.agregar(item["id"], item)
+                tienda.orden.agregar_lote(lote)
+            render_lista()
+        avisar_sesiones()
+
+    @metricas.medir("ui.transferir")
+    def transferir(accion):
+        ruta = (ruta_transferencia.value or "").strip()
+        if not ruta:
+            return
+
+        def trabajo():
+            # no mezclar con una colección a medio cargar
+            carga_completa.wait()
+            try:
+                if accion == "importar":
+                    n = importar_notas(ruta, confirmar_importacion, al_progreso_transferencia)
+                    estado_transferencia.value = f"{n:,} notas importadas"
+                else:
+                    # hilo sin el cerrojo de la tienda: se exporta una copia
+                    n = exportar_notas(tienda.data.lista(), ruta, al_progreso_transferencia)
+                    estado_transferencia.value = f"{n:,} notas exportadas"
+            except Exception as ex:
+                estado_transferencia.value = f"Interrumpida ({ex}); repítela para continuar"
+            progreso_transferencia.visible = False
+            pagina.marcar()
+
+        progreso_transferencia.value = None
+        progreso_transferencia.visible = True
+        estado_transferencia.value = ""
+        pagina.marcar()
+        page.run_thread(trabajo)
+    separation = ft.Container(height=0, content=seeker, animate_size=ft.Animation(600, ft.AnimationCurve.BOUNCE_OUT))
+
+    # Previews renderizados por nota (LRU pequeño: cada uno guarda sus controles)
+    previews = collections.OrderedDict()
+
+    def preview_nota(nota_id):
+        clave = nota_id or "nueva"
+        pv = previews.pop(clave, None) or PreviewMarkdown()
+        previews[clave] = pv
+        while len(previews) > PREVIEW_CACHE_NOTAS:
+            previews.popitem(last=False)
+        return pv
 
     # -------------------------
     # RUTAS: VISTAS
     # -------------------------
-    def route_change(route):
-        page.views.clear()
-
-        # PANTALLA PRINCIPAL
-        if page.route == "/":
-            page.views.append(
-                ft.View(
-                    padding=ft.padding.only(left=12, right=12, bottom=12, top=12),
-                    route="/",
-                    controls=[
-                        separation,
-                        note_text,
-                        ft.Divider(),
-                        ft.Container(
-                            content=ft.Column(
-                                controls=[
-                                    lista_contenedores,
-                                    ft.Container(width=0, height=0, visible=False),
-                                ]
-                            ),
+    # Cada pantalla se construye una sola vez y se reutiliza en las siguientes
+    # navegaciones; el formulario solo re-vincula los datos de la nota abierta.
+    # La principal queda siempre montada en page.views[0] y las demás se apilan encima.
+    vistas = {}
+    formulario = {"nota_id": None, "is_edit": False, "color": THEME["bg"], "color2": THEME["bg2"], "pw": False, "tabla": None, "ventana": (0, 0), "modificado": None}
+
+    def invalidar_vista(clave):
+        """Descarta una vista cacheada; se reconstruye en la próxima navegación."""
+        vistas.pop(clave, None)
+
+    def vista(clave, construir):
+        v = vistas.get(clave)
+        if v is None:
+            v = vistas[clave] = construir()
+        return v
+
+    # PANTALLA PRINCIPAL
+    def construir_inicio():
+        return ft.View(
+            padding=ft.padding.only(left=12, right=12, bottom=12, top=12),
+            route="/",
+            controls=[
+                separation,
+                note_text,
+                progreso_carga,
+                ft.Divider(),
+                barra_seleccion,
+                tema(
+                    ft.Container(
+                        content=ft.Column(
                             expand=True,
-                            padding=10,
-                            border_radius=ImportantVars.bradius,
+                            controls=[
+                                grid_scroll,
+                                ft.Container(width=0, height=0, visible=False),
+                            ]
                         ),
-                        ft.Container(
-                            height=60,
-                            alignment=ft.alignment.center_right,
-                            on_long_press=reapariton_of_delete_button,
-                            content=ft.Row(
+                        expand=True,
+                        padding=10,
+                    ),
+                    border_radius="radio",
+                ),
+                ft.Container(
+                    height=60,
+                    alignment=ft.alignment.center_right,
+                    on_long_press=reapariton_of_delete_button,
+                    content=ft.Row(
+                        expand=True,
+                        controls=[
+                            ft.Container(margin=10, content=tra),
+                            ft.Container(
                                 expand=True,
-                                controls=[
-                                    ft.Container(margin=10, content=tra),
-                                    ft.Container(
-                                        expand=True,
-                                        alignment=ft.alignment.center_right,
-                                        content=ft.IconButton(
-                                            icon=ft.Icons.DRIVE_FILE_RENAME_OUTLINE,
-                                            bgcolor=ft.Colors.TRANSPARENT,
-                                            on_click=ir_a_form,
-                                            icon_color=THEME["text"],
-                                        ),
+                                alignment=ft.alignment.center_right,
+                                content=tema(
+                                    ft.IconButton(
+                                        icon=ft.Icons.DRIVE_FILE_RENAME_OUTLINE,
+                                        bgcolor=ft.Colors.TRANSPARENT,
+                                        on_click=ir_a_form,
                                     ),
-                                ],
+                                    icon_color="text",
+                                ),
                             ),
-                        ),
-                    ],
-                )
-            )
+                        ],
+                    ),
+                ),
+            ],
+        )
 
-        # PANTALLA DE AJUSTES
-        elif page.route.startswith("/settings"):
-            page.views.append(
-                ft.View(
-                    route=page.route,
-                    controls=[
-                        ft.Container(
-                            margin=ft.margin.only(top=30),
-                            height=50,
-                            content=ft.Row(
-                                controls=[
-                                    ft.IconButton(icon=ft.Icons.ARROW_BACK_IOS_SHARP, on_click=volver_a_inicio, icon_color=THEME["text"]),
-                                    ft.Text("Settings", size=20, color=THEME["text"]),
-                                ]
-                            ),
-                        ),
-                        ft.Container(
-                            padding=10,
-                            border_radius=ImportantVars.bradius,
-                            border=ft.border.all(1, THEME["a1"]),
-                            bgcolor=THEME["a2"],
-                            content=ft.Column(
-                                controls=[
-                                    ft.Row(
-                                        controls=[
-                                            ft.Text("Seleccionar tema", size=18, color=THEME["text"]),
-                                            ft.Container(expand=True),
-                                            ft.Container(alignment=ft.alignment.center_right, content=change_text_button),
-                                        ]
-                                    ),
-                                    importan_mensaje_theme,
-                                    ft.Divider(color=THEME["text"]),
-                                    ft.Row(
-                                        controls=[ft.Text("Tamaño de fuente", size=18, color=THEME["text"]), ft.Container(expand=True), change_size_button]
-                                    ),
-                                    ft.Divider(color=THEME["text"]),
-                                    ft.Row(controls=[ft.Text("Previsualización", size=18, color=THEME["text"]), ft.Container(expand=True), preview]),
-                                    ft.Divider(color=THEME["text"]),
-                                    ft.Row(
-                                        controls=[
-                                            ft.Text("Radio del borde", size=18, color=THEME["text"]),
-                                            ft.Container(expand=True),
-                                            change_radius_button,
-                                            resetValuebutton,
-                                        ]
-                                    ),
-                                    importan_mensaje_radius,
-                                ]
-                            ),
+    # PANTALLA DE AJUSTES
+    def construir_ajustes():
+        return ft.View(
+            route="/settings",
+            controls=[
+                ft.Container(
+                    margin=ft.margin.only(top=30),
+                    height=50,
+                    content=ft.Row(
+                        controls=[
+                            tema(ft.IconButton(icon=ft.Icons.ARROW_BACK_IOS_SHARP, on_click=volver_a_inicio), icon_color="text"),
+                            tema(ft.Text("Settings", size=20), color="text"),
+                        ]
+                    ),
+                ),
+                tema(
+                    ft.Container(
+                        padding=10,
+                        content=ft.Column(
+                            controls=[
+                                ft.Row(
+                                    controls=[
+                                        tema(ft.Text("Seleccionar tema", size=18), color="text"),
+                                        ft.Container(expand=True),
+                                        ft.Container(alignment=ft.alignment.center_right, content=change_text_button),
+                                    ]
+                                ),
+                                importan_mensaje_theme,
+                                tema(ft.Divider(), color="text"),
+                                ft.Row(
+                                    controls=[tema(ft.Text("Tamaño de fuente", size=18), color="text"), ft.Container(expand=True), change_size_button]
+                                ),
+                                tema(ft.Divider(), color="text"),
+                                ft.Row(controls=[tema(ft.Text("Previsualización", size=18), color="text"), ft.Container(expand=True), preview]),
+                                tema(ft.Divider(), color="text"),
+                                ft.Row(controls=[tema(ft.Text("Búsqueda tolerante", size=18), color="text"), ft.Container(expand=True), fuzzy]),
+                                tema(ft.Divider(), color="text"),
+                                ft.Row(
+                                    controls=[
+                                        tema(ft.Text("Radio del borde", size=18), color="text"),
+                                        ft.Container(expand=True),
+                                        change_radius_button,
+                                        resetValuebutton,
+                                    ]
+                                ),
+                                importan_mensaje_radius,
+                                tema(ft.Divider(), color="text"),
+                                ft.Row(
+                                    controls=[
+                                        ruta_transferencia,
+                                        tema(ft.IconButton(icon=ft.Icons.FILE_UPLOAD_OUTLINED, tooltip="Importar", on_click=lambda e: transferir("importar")), icon_color="text"),
+                                        tema(ft.IconButton(icon=ft.Icons.FILE_DOWNLOAD_OUTLINED, tooltip="Exportar", on_click=lambda e: transferir("exportar")), icon_color="text"),
+                                    ]
+                                ),
+                                progreso_transferencia,
+                                estado_transferencia,
+                            ]
                         ),
-                        ft.Container(expand=True),
-                    ],
-                )
-            )
+                    ),
+                    border_radius="radio",
+                    border="a1",
+                    bgcolor="a2",
+                ),
+                ft.Container(expand=True),
+            ],
+        )
 
-        # PANTALLA FORM (crear / editar nota)
-        elif page.route.startswith("/form") or page.route.startswith("/edit"):
-            
-            text_field_main = ft.TextField(multiline=True, expand=True, border_width=0, border_radius=30, text_size=18,)
-            nombre_field = ft.TextField(border_width=0, border_radius=30, text_size=25, hint_text='Título')
-            preview_markdown = ft.Markdown(value="", selectable=True, expand=True, )
-
-        
-
-            is_edit = page.route.startswith("/edit")
-            item_index = -1
-            initial_name = ""
-            initial_color = THEME["bg"]
-            initial_color2 = THEME["bg2"]
-            initial_preview = False
-
-            def toggle_preview(e):
-                value = settings['pw']
-                if value == False:
-                    # Cambiar a PREVIEW
-                    preview_markdown.value = text_field_main.value
-                    editor_container.content = preview_markdown
-                    settings['pw'] = True
-                    save_settings(settings)
-                else:
-                    # Volver a modo EDICIÓN
-                    editor_container.content = text_field_main
-                    settings['pw'] = False
-                    save_settings(settings)
-
-                page.update()
-            
-            preview_switch = ft.Switch(label="Preview", value=False, on_change=toggle_preview)
-
-            editor_container = ft.Container(
-                expand=True,
-                content=text_field_main,  # inicia en modo edición
-            )
+    # PANTALLA FORM (crear / editar nota)
+    @metricas.medir("ui.toggle_preview")
+    def toggle_preview(e):
+        campos = vistas["form"].data
+        value = settings['pw']
+        if value == False:
+            # Cambiar a PREVIEW: el campo sigue montado, solo se oculta
+            contenido = preview_nota(formulario["nota_id"]).mostrar(campos["texto"].value)
+            if campos["previa"].content is not contenido:
+                campos["previa"].content = contenido
+            campos["texto"].visible = False
+            campos["previa"].visible = True
+            settings['pw'] = True
+            save_settings(settings)
+        else:
+            # Volver a modo EDICIÓN
+            modo_edicion(campos)
+            settings['pw'] = False
+            save_settings(settings)
+
+        pagina.marcar()
+
+    def modo_edicion(campos):
+        campos["texto"].visible = True
+        campos["previa"].visible = False
+
+    # Notas grandes: el campo de texto solo contiene una ventana de la tabla de piezas
+    def confirmar_ventana():
+        """Pasa a la tabla de piezas lo editado en la ventana visible, si cambió."""
+        tabla = formulario["tabla"]
+        ini, fin = formulario["ventana"]
+        valor = vistas["form"].data["texto"].value or ""
+        previo = tabla.texto(ini, fin)
+        if valor == previo:
+            return
+        # acotar al tramo realmente editado (prefijo y sufijo comunes fuera)
+        a = 0
+        tope = min(len(valor), len(previo))
+        while a < tope and valor[a] == previo[a]:
+            a += 1
+        z = 0
+        while z < tope - a and valor[-1 - z] == previo[-1 - z]:
+            z += 1
+        tabla.reemplazar(ini + a, fin - z, valor[a:len(valor) - z])
+        formulario["ventana"] = (ini, ini + len(valor))
+
+    def mostrar_ventana(ini):
+        campos = vistas["form"].data
+        tabla = formulario["tabla"]
+        fin = tabla.fin_de_linea(ini + EDITOR_VENTANA)
+        formulario["ventana"] = (ini, fin)
+        campos["texto"].value = tabla.texto(ini, fin)
+        campos["posicion"].value = f"{ini:,} – {fin:,} de {len(tabla):,}"
+        modo_edicion(campos)
+
+    @metricas.medir("ui.mover_ventana")
+    def mover_ventana(paso):
+        confirmar_ventana()
+        tabla = formulario["tabla"]
+        ini, fin = formulario["ventana"]
+        if paso > 0 and fin < len(tabla):
+            mostrar_ventana(fin)
+        elif paso < 0 and ini > 0:
+            mostrar_ventana(tabla.inicio_de_linea(max(0, ini - EDITOR_VENTANA)))
+        pagina.marcar()
+
+    @metricas.medir("ui.guardar_o_editar")
+    def guardar_o_editar(e):
+        campos = vistas["form"].data
+        nota_id = formulario["nota_id"]
+        is_edit = formulario["is_edit"]
+        nombre = campos["nombre"].value or "Sin nombre"
+        color = formulario["color"] or "#FFFFFF"
+        color2 = formulario["color2"] or "#FFFFFF"
+        tabla = formulario["tabla"]
+        if tabla is not None:
+            confirmar_ventana()
+            TextValue = str(tabla)
+        else:
+            TextValue = campos["texto"].value or ""
+
+        if not color.startswith("#"):
+            color = "#" + color
+        if not color2.startswith("#"):
+            color2 = "#" + color2
+
+        nuevo_item = {
+            "id": nota_id or nuevo_id(),
+            "Type": 1,
+            "nombre": nombre,
+            "color": color,
+            "color2": color2,
+            "text": TextValue,
+            "pw": formulario["pw"]
+        }
 
+        carga_completa.wait()
+        data = tienda.data
+        if is_edit and nota_id not in data:
+            return
+        # guardar, redibujar y volver al inicio en un solo envío al cliente
+        with pagina.batch(), tienda.escritura():
             if is_edit:
-                try:
-                    item_index = int(page.route.split("/")[-1])
-                    if 0 <= item_index < len(data):
-                        item_data = data[item_index]
-                        initial_name = item_data.get("nombre", "")
-                        initial_color = item_data.get("color", THEME["bg"])
-                        initial_color2 = item_data.get("color2", THEME["bg2"])
-                        text_field_main.value = item_data.get("text", "")
-                        initial_preview = item_data.get("pw", "")
-                    else:
-                        page.go("/")
-                        page.update()
-                        return
-                except ValueError:
-                    page.go("/")
-                    page.update()
-                    return
-                nombre_field.value = initial_name
-                Color = initial_color
-                Color2 = initial_color2
-            else:
-                # creación
-                nombre_field.value = ""
-                Color = THEME["bg"]
-                Color2 = THEME["bg2"]
-                text_field_main.value = ""
-
-            def guardar_o_editar(e):
-                nombre = nombre_field.value or "Sin nombre"
-                color = Color or "#FFFFFF"
-                color2 = Color2 or "#FFFFFF"
-                TextValue = text_field_main.value or ""
-
-                if not color.startswith("#"):
-                    color = "#" + color
-                if not color2.startswith("#"):
-                    color2 = "#" + color2
-
-                nuevo_item = {
-                    "Type": 1,
-                    "nombre": nombre,
-                    "color": color,
-                    "color2": color2,
-                    "text": TextValue,
-                    "pw": initial_preview
-                }
-
-                if is_edit:
-                    if 0 <= item_index < len(data):
-                        data[item_index] = nuevo_item
-                    else:
-                        return
+                if tabla is not None and data.get(nota_id).get("modificado") == formulario["modificado"]:
+                    # el almacén recibe solo los rangos editados
+                    nota_parchear(data, nuevo_item, tabla.cambios)
                 else:
-                    data.append(nuevo_item)
+                    # nota normal, o grande que otra sesión guardó desde que se abrió
+                    # (sus rangos ya no aplican sobre el cuerpo guardado): entera
+                    nota_actualizar(data, nuevo_item)
+            else:
+                nota_crear(data, nuevo_item)
+            with lock_datos:
+                indice.quitar(nuevo_item["id"])
+                trigramas_idx.quitar(nuevo_item["id"])
+                indice.agregar(nuevo_item["id"], nuevo_item)
+                trigramas_idx.agregar(nuevo_item["id"], nuevo_item)
+                tienda.orden.agregar(nuevo_item["id"], nuevo_item)
 
-                guardar_datos(data)
-                render_lista()
-                page.go("/")
+            render_lista()
+            page.go("/")
+        avisar_sesiones()
+
+    def construir_formulario():
+        text_field_main = ft.TextField(multiline=True, expand=True, border_width=0, border_radius=30, text_size=18,)
+        nombre_field = ft.TextField(border_width=0, border_radius=30, text_size=25, hint_text='Título')
+
+        # campo y preview quedan montados a la vez; alternar solo cambia `visible`
+        previa = ft.Container(expand=True, visible=False)
+        editor_container = ft.Container(
+            expand=True,
+            content=ft.Column(expand=True, spacing=0, controls=[text_field_main, previa]),  # inicia en modo edición
+        )
 
-            # color contrast calculation para el campo (simple)
-            try:
-                hex_color = color.lstrip("#")
-                r = int(hex_color[0:2], 16)
-                g = int(hex_color[2:4], 16)
-                b = int(hex_color[4:6], 16)
-                luminance = (0.2126 * r + 0.7152 * g + 0.0722 * b) / 255
-                text_color = ft.Colors.BLACK if luminance > 0.5 else ft.Colors.WHITE
-            except Exception:
-                text_color = ft.Colors.WHITE
+        # navegación entre ventanas (solo visible con notas grandes)
+        posicion = ft.Text("", size=12, color=THEME["text"])
+        navegacion = ft.Row(
+            visible=False,
+            alignment=ft.MainAxisAlignment.CENTER,
+            controls=[
+                ft.IconButton(icon=ft.Icons.KEYBOARD_ARROW_UP, on_click=lambda e: mover_ventana(-1), icon_color=THEME["text"]),
+                posicion,
+                ft.IconButton(icon=ft.Icons.KEYBOARD_ARROW_DOWN, on_click=lambda e: mover_ventana(1), icon_color=THEME["text"]),
+            ],
+        )
 
-            nombre_field.color = text_color
-            text_field_main.color = text_color
+        marco = ft.Container(
+            content=ft.Column(
+                controls=[
+                    nombre_field,
+                    ft.Divider(),
+                    editor_container,
+                    navegacion,
+                    ft.Row(
+                        controls=[
+                            ft.Container(
+                                margin=ft.margin.only(top=0),
+                                content=ft.IconButton(icon=ft.Icons.CLOSE, on_click=volver_a_inicio, bgcolor=ft.Colors.TRANSPARENT, icon_color=THEME["text"]),
+                                expand=True,
+                                on_long_press=toggle_preview,
+                                alignment=ft.alignment.center_left,    
+                            ),
+                            ft.IconButton(icon=ft.Icons.CHECK, on_click=guardar_o_editar, bgcolor=ft.Colors.TRANSPARENT, icon_color=THEME["text"]),
+                        ]
+                    ),
+                ]
+            ),
+            expand=True,
+            margin=ft.margin.only(top=11),
+            padding=5,
+            gradient=ft.LinearGradient(begin=ft.alignment.top_center, end=ft.alignment.bottom_center, colors=[THEME["bg"], THEME["bg2"]]),
+            border_radius=ImportantVars.bradius,
+        )
 
-            page.views.append(
-                ft.View(
-                    route=page.route,
-                    controls=[
-                        ft.Column(
-                            controls=[
-                                ft.Container(
-                                    content=ft.Column(
-                                        controls=[
-                                            nombre_field,
-                                            ft.Divider(),
-                                            editor_container,
-                                            ft.Row(
-                                                controls=[
-                                                    ft.Container(
-                                                        margin=ft.margin.only(top=0),
-                                                        content=ft.IconButton(icon=ft.Icons.CLOSE, on_click=volver_a_inicio, bgcolor=ft.Colors.TRANSPARENT, icon_color=THEME["text"]),
-                                                        expand=True,
-                                                        on_long_press=toggle_preview,
-                                                        alignment=ft.alignment.center_left,    
-                                                    ),
-                                                    ft.IconButton(icon=ft.Icons.CHECK, on_click=guardar_o_editar, bgcolor=ft.Colors.TRANSPARENT, icon_color=THEME["text"]),
-                                                ]
-                                            ),
-                                        ]
-                                    ),
-                                    expand=True,
-                                    margin=ft.margin.only(top=11),
-                                    padding=5,
-                                    gradient=ft.LinearGradient(begin=ft.alignment.top_center, end=ft.alignment.bottom_center, colors=[THEME["bg"], THEME["bg2"]]),
-                                    bgcolor=Color,
-                                    border=ft.border.all(1, Color),
-                                    border_radius=ImportantVars.bradius,
-                                    shadow=ft.BoxShadow(
-                                        spread_radius=1,
-                                        blur_radius=3,
-                                        color=Color,
-                                        offset=ft.Offset(0, 0),
-                                        blur_style=ft.ShadowBlurStyle.OUTER,
-                                    ),
-                                ),
-                            ],
-                            expand=True,
-                            alignment=ft.MainAxisAlignment.START,
-                            spacing=20,
-                        )
-                    ],
+        v = ft.View(
+            route="/form",
+            controls=[
+                ft.Column(
+                    controls=[marco],
+                    expand=True,
+                    alignment=ft.MainAxisAlignment.START,
+                    spacing=20,
                 )
+            ],
+        )
+        v.data = {
+            "texto": text_field_main,
+            "nombre": nombre_field,
+            "editor": editor_container,
+            "previa": previa,
+            "marco": marco,
+            "navegacion": navegacion,
+            "posicion": posicion,
+        }
+        return v
+
+    def vincular_formulario(v):
+        """Carga en la vista cacheada del formulario la nota de la ruta actual."""
+        campos = v.data
+        is_edit = page.route.startswith("/edit")
+        nota_id = None
+        initial_preview = False
+        texto = ""
+        modificado = None
+
+        if is_edit:
+            nota_id = page.route.split("/")[-1]
+            item_data = tienda.data.get(nota_id)
+            if item_data is None:
+                return False
+            Color = item_data.get("color", THEME["bg"])
+            Color2 = item_data.get("color2", THEME["bg2"])
+            campos["nombre"].value = item_data.get("nombre", "")
+            texto = item_data.get("text", "")
+            initial_preview = item_data.get("pw", "")
+            modificado = item_data.get("modificado")
+        else:
+            # creación
+            Color = THEME["bg"]
+            Color2 = THEME["bg2"]
+            campos["nombre"].value = ""
+
+        # notas grandes: se editan por ventanas sobre una tabla de piezas (sin copiar el cuerpo)
+        tabla = TablaPiezas(texto) if len(texto) >= EDITOR_GRANDE_MIN else None
+        formulario.update(nota_id=nota_id, is_edit=is_edit, color=Color, color2=Color2, pw=initial_preview, tabla=tabla, modificado=modificado)
+        campos["navegacion"].visible = tabla is not None
+        if tabla is not None:
+            mostrar_ventana(0)
+        else:
+            campos["texto"].value = texto
+        modo_edicion(campos)
+
+        # color contrast calculation para el campo (simple)
+        try:
+            hex_color = Color.lstrip("#")
+            r = int(hex_color[0:2], 16)
+            g = int(hex_color[2:4], 16)
+            b = int(hex_color[4:6], 16)
+            luminance = (0.2126 * r + 0.7152 * g + 0.0722 * b) / 255
+            text_color = ft.Colors.BLACK if luminance > 0.5 else ft.Colors.WHITE
+        except Exception:
+            text_color = ft.Colors.WHITE
+
+        campos["nombre"].color = text_color
+        campos["texto"].color = text_color
+
+        marco = campos["marco"]
+        marco.bgcolor = Color
+        marco.border = ft.border.all(1, Color)
+        marco.shadow = ft.BoxShadow(
+            spread_radius=1,
+            blur_radius=3,
+            color=Color,
+            offset=ft.Offset(0, 0),
+            blur_style=ft.ShadowBlurStyle.OUTER,
+        )
+        v.route = page.route
+        return True
+
+    @metricas.medir("ui.route_change")
+    def route_change(route):
+        inicio = vista("inicio", construir_inicio)
+        if not page.views or page.views[0] is not inicio:
+            page.views[:] = [inicio]
+        encima = None
+
+        if page.route.startswith("/settings"):
+            encima = vista("ajustes", construir_ajustes)
+            encima.route = page.route
+
+        elif page.route.startswith("/form") or page.route.startswith("/edit"):
+            v = vista("form", construir_formulario)
+            if not vincular_formulario(v):
+                page.go("/")
+                pagina.marcar()
+                return
+            encima = v
+
+        # PANTALLA DE DEPURACIÓN: resumen de métricas (no se cachea, cambia en cada visita)
+        elif page.route == "/metricas" and metricas.activas:
+            encima = ft.View(
+                route="/metricas",
+                scroll=ft.ScrollMode.AUTO,
+                controls=[
+                    tema(ft.IconButton(icon=ft.Icons.ARROW_BACK_IOS_SHARP, on_click=volver_a_inicio), icon_color="text"),
+                    tema(ft.Text(json.dumps(metricas.resumen(), indent=2), selectable=True, font_family="monospace", size=12), color="text"),
+                ],
             )
-        page.update()
+
+        # solo se desmonta lo apilado sobre la principal, y solo si cambia
+        while len(page.views) > 1 and page.views[-1] is not encima:
+            page.views.pop()
+        if encima is not None and page.views[-1] is not encima:
+            page.views.append(encima)
+        pagina.marcar()
+        pagina.flush()
+
+    def view_pop(e):
+        # atrás del sistema: se vuelve a la vista de debajo (siempre queda la principal)
+        if len(page.views) > 1:
+            page.views.pop()
+        page.go(page.views[-1].route)
 
     page.on_route_change = route_change
+    page.on_view_pop = view_pop
+    def al_desconectar(e):
+        page.pubsub.unsubscribe_all()
+        with contextlib.suppress(ValueError):
+            escrituras.al_fallar.remove(al_fallar_escritura)
+        indice.guardar()
+        escrituras.flush()
+        metricas.volcar()
+
+    page.on_disconnect = al_desconectar
     page.go("/")
 
+    # -------------------------
+    # CARGA EN SEGUNDO PLANO
+    # -------------------------
+    def al_lote(notas, lote):
+        with lock_datos:
+            tienda.data = notas
+            for item in lote:
+                indice.agregar(item["id"], item)
+                # sin efecto hasta que una búsqueda difusa construya el índice
+                trigramas_idx.agregar(item["id"], item)
+            tienda.orden.agregar_lote(lote)
+        render_lista()
+        avisar_sesiones()
+
+    def cargar_en_segundo_plano():
+        try:
+            notas = cargar_datos(al_lote)
+            with lock_datos:
+                tienda.data = notas
+        finally:
+            carga_completa.set()
+        al_cambiar_notas(TEMA_NOTAS, None)
+        avisar_sesiones()
+        indice.guardar()
+
+    if debe_cargar:
+        page.run_thread(cargar_en_segundo_plano)
+    else:
+        al_cambiar_notas(TEMA_NOTAS, None)
+
+
+# -------------------------
+# IMPORTAR / EXPORTAR SIN PANTALLA
+# -------------------------
+def main_transferencia(argv):
+    """`python main.py importar|exportar RUTA`: usa el almacén de settings.json sin abrir la app."""
+    parser = argparse.ArgumentParser(description="Importa o exporta notas en NDJSON o carpetas Markdown")
+    parser.add_argument("accion", choices=("importar", "exportar"))
+    parser.add_argument("ruta", help="archivo .ndjson/.jsonl o carpeta de .md")
+    parser.add_argument("--lote", type=int, default=TRANSFERENCIA_LOTE, help="notas por lote confirmado")
+    args = parser.parse_args(argv)
+    # la app abierta reescribiría el almacén con su copia en memoria y perdería lo importado
+    if args.accion == "importar" and not uso_almacen.exclusivo():
+        parser.exit(1, "La app tiene las notas abiertas: ciérrala o importa desde Ajustes.\n")
+
+    settings = load_settings()
+    configurar_almacen(settings.get("storage", "json"), settings.get("compresion", ""))
+
+    def mostrar(hechas, fraccion):
+        porcentaje = f" ({fraccion:.0%})" if fraccion is not None else ""
+        print(f"\r{hechas:,} notas{porcentaje}", end="", flush=True)
+
+    if args.accion == "importar":
+        # cada lote va directo al almacén: la colección no se carga
+        n = importar_notas(args.ruta, nota_importar, mostrar, args.lote)
+        _almacen.terminar_importacion()
+    else:
+        n = exportar_notas(_almacen.recorrer(), args.ruta, mostrar, args.lote)
+    _almacen.cerrar()
+    print(f"\n{n:,} notas {'importadas' if args.accion == 'importar' else 'exportadas'}")
+
 
 if __name__ == "__main__":
-    ft.app(target=main, view=ft.AppView.FLET_APP)
+    if sys.argv[1:2] in (["importar"], ["exportar"]):
+        main_transferencia(sys.argv[1:])
+    else:
+        ft.app(target=main, view=ft.AppView.FLET_APP)
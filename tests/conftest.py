@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+@pytest.fixture
+def carpeta(tmp_path, monkeypatch):
+    """Directorio vacío por test: los archivos de datos de main son rutas relativas."""
+    monkeypatch.chdir(tmp_path)
+    main.escrituras.ultimo_error = None
+    yield tmp_path
+    # lo pendiente se escribe aquí, no en el directorio del siguiente test
+    main.escrituras.flush()
+    main.configurar_almacen("json")
+
+
+def reabrir(modo, compresion=""):
+    """Almacén nuevo sobre los mismos archivos, como al arrancar otra vez la app."""
+    main.escrituras.flush()
+    assert main.escrituras.ultimo_error is None
+    main.configurar_almacen(modo, compresion)
+    return main.cargar_datos()
@@ -0,0 +1,327 @@
+"""Ida y vuelta por disco de cada almacén: escribir, `escrituras.flush()` y recargar."""
+
+import json
+import sqlite3
+import zlib
+
+import pytest
+
+import main
+from conftest import reabrir
+
+ALMACENES = ("json", "journal", "sqlite", "split")
+
+
+def escribir_json(path, obj):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+
+
+def textos(notas):
+    return [(item["nombre"], item["text"]) for item in notas]
+
+
+# -------------------------
+# JOURNAL
+# -------------------------
+def test_journal_reproduce_registros_posicionales(carpeta):
+    # log anterior a los ids: los registros apuntan a posiciones de la lista
+    escribir_json(main.DATA_FILE, [{"nombre": n, "text": n * 2} for n in "abc"])
+    registros = [
+        {"seq": 1, "op": "create", "item": {"nombre": "d", "text": "dd"}},
+        {"seq": 2, "op": "update", "index": 0, "item": {"nombre": "A", "text": "AA"}},
+        {"seq": 3, "op": "delete", "index": 1},
+    ]
+    with open(main.DATA_JOURNAL, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(r) + "\n" for r in registros)
+        f.write('{"seq": 4, "op": "del')  # cierre abrupto a mitad de línea
+
+    notas = reabrir("journal")
+    assert textos(notas) == [("A", "AA"), ("c", "cc"), ("d", "dd")]
+    ids = [item["id"] for item in notas]
+    assert all(ids)
+
+    # los ids asignados se guardaron (snapshot compactado) y el log quedó recortado
+    notas = reabrir("journal")
+    assert [item["id"] for item in notas] == ids
+    assert textos(notas) == [("A", "AA"), ("c", "cc"), ("d", "dd")]
+    with open(main.DATA_JOURNAL, encoding="utf-8") as f:
+        assert f.read() == ""
+
+
+def test_journal_reproduce_lotes_y_parches_tras_el_snapshot(carpeta):
+    escribir_json(main.DATA_FILE, [])
+    notas = reabrir("journal")
+    main.nota_crear(notas, {"nombre": "uno", "text": "hola mundo"})
+    main.nota_lote(notas, [{"nombre": f"n{i}", "text": str(i)} for i in range(3)], [])
+    uno = next(item for item in notas if item["nombre"] == "uno")
+    tabla = main.TablaPiezas(uno["text"])
+    tabla.reemplazar(5, 10, "journal")
+    main.nota_parchear(notas, dict(uno, text=str(tabla)), tabla.cambios)
+    main.nota_lote(notas, [], [next(item["id"] for item in notas if item["nombre"] == "n1")])
+
+    recargadas = reabrir("journal")
+    assert textos(recargadas) == [("uno", "hola journal"), ("n0", "0"), ("n2", "2")]
+    # el parche va al log como rangos, no como cuerpo entero
+    with open(main.DATA_JOURNAL, encoding="utf-8") as f:
+        parche = [json.loads(linea) for linea in f if '"patch"' in linea][0]
+    assert "text" not in parche["item"] and parche["cambios"] == [[5, 10, "journal"]]
+
+
+# -------------------------
+# SQLITE
+# -------------------------
+def test_sqlite_migra_filas_sin_uid(carpeta):
+    # base anterior a los ids estables y a la columna firma
+    conn = sqlite3.connect(main.DATA_SQLITE)
+    conn.executescript(
+        """
+        CREATE TABLE notas (id INTEGER PRIMARY KEY AUTOINCREMENT, pos INTEGER NOT NULL, Type INTEGER,
+            nombre TEXT, color TEXT, color2 TEXT, text TEXT, pw TEXT, extra TEXT, creado REAL, modificado REAL);
+        CREATE TABLE meta (clave TEXT PRIMARY KEY, valor TEXT);
+        INSERT INTO meta VALUES ('migrado_json', '1');
+        """
+    )
+    conn.executemany(
+        "INSERT INTO notas (pos, Type, nombre, text, pw) VALUES (?, 1, ?, ?, 'false')",
+        [(i, f"n{i}", f"cuerpo {i}") for i in range(4)],
+    )
+    conn.commit()
+    conn.close()
+
+    notas = reabrir("sqlite")
+    ids = [item["id"] for item in notas]
+    assert len(set(ids)) == 4 and all(ids)
+    assert textos(notas) == [(f"n{i}", f"cuerpo {i}") for i in range(4)]
+
+    notas = reabrir("sqlite")
+    assert [item["id"] for item in notas] == ids
+    assert all(isinstance(item, main.NotaPerezosa) for item in notas)
+    main.nota_actualizar(notas, dict(notas.get(ids[1]), text="editado"))
+    main.nota_eliminar(notas, ids[2])
+
+    notas = reabrir("sqlite")
+    assert textos(notas) == [("n0", "cuerpo 0"), ("n1", "editado"), ("n3", "cuerpo 3")]
+    conn = sqlite3.connect(main.DATA_SQLITE)
+    assert conn.execute("SELECT COUNT(*) FROM notas WHERE uid IS NULL OR firma IS NULL").fetchone()[0] == 0
+    conn.close()
+
+
+def test_sqlite_migra_contenedores_json(carpeta):
+    escribir_json(main.DATA_FILE, [{"nombre": "vieja", "text": "del json"}])
+    notas = reabrir("sqlite")
+    assert textos(notas) == [("vieja", "del json")]
+    assert textos(reabrir("sqlite")) == [("vieja", "del json")]
+
+
+# -------------------------
+# SPLIT
+# -------------------------
+def test_split_compacta_el_archivo_de_cuerpos(carpeta, monkeypatch):
+    monkeypatch.setattr(main, "CUERPOS_BASURA_MAX", 0)
+    escribir_json(main.DATA_FILE, [{"nombre": f"n{i}", "text": "x" * 100} for i in range(4)])
+    notas = reabrir("split")
+    nota_id = next(iter(notas))["id"]
+    for i in range(10):
+        main.nota_actualizar(notas, dict(notas.get(nota_id), text=f"version {i} " + "y" * 100))
+        almacen = main._almacen
+        # el espacio muerto nunca pasa de la mitad del archivo: se compacta al superarla
+        assert almacen.basura <= (carpeta / main.DATA_SPLIT_BODIES).stat().st_size // 2
+
+    notas = reabrir("split")
+    assert notas.get(nota_id)["text"] == "version 9 " + "y" * 100
+    assert [item["text"] for item in notas][1:] == ["x" * 100] * 3
+
+
+@pytest.mark.parametrize("desde, hacia", [("", "zlib"), ("zlib", "")])
+def test_split_reescribe_cuerpos_al_cambiar_de_codec(carpeta, desde, hacia):
+    originales = [{"nombre": f"n{i}", "text": f"cuerpo {i} " * 50} for i in range(5)]
+    escribir_json(main.DATA_FILE, originales)
+    reabrir("split", desde)
+
+    notas = reabrir("split", hacia)
+    assert textos(notas) == textos(originales)
+    with open(main.DATA_SPLIT_INDEX, encoding="utf-8") as f:
+        indice = json.load(f)
+    assert indice["compresion"] == hacia
+    with open(main.DATA_SPLIT_BODIES, "rb") as f:
+        cuerpos = f.read()
+    off, n = indice["notas"][0]["_cuerpo"]
+    primero = cuerpos[off:off + n]
+    assert (zlib.decompress(primero) if hacia else primero).decode("utf-8") == originales[0]["text"]
+
+    assert textos(reabrir("split", hacia)) == textos(originales)
+
+
+# -------------------------
+# ESCRITURA DIFERIDA
+# -------------------------
+def test_escritura_fallida_se_avisa_y_se_reintenta(carpeta, monkeypatch):
+    avisos, hechas = [], []
+    monkeypatch.setattr(main.escrituras, "al_fallar", [lambda clave, ex: avisos.append(clave)])
+    escribir_json(main.DATA_FILE, [{"id": "a", "nombre": "a", "text": "a"}])
+    notas = reabrir("json")
+    main.escrituras.flush()
+
+    bloqueo = carpeta / (main.DATA_FILE + ".tmp")
+    bloqueo.mkdir()  # escribir_json no puede crear su temporal
+    main.nota_crear(notas, {"id": "b", "nombre": "b", "text": "b"})
+    main.escrituras.programar("detras", lambda: hechas.append("detras"))
+    main.escrituras.flush()
+    assert set(avisos) == {main.DATA_FILE}
+    assert isinstance(main.escrituras.ultimo_error, OSError)
+    # lo que venía detrás espera a la escritura fallida: el orden se conserva
+    assert hechas == []
+
+    bloqueo.rmdir()
+    main.escrituras.flush()
+    assert hechas == ["detras"]
+    main.escrituras.ultimo_error = None
+    assert textos(reabrir("json")) == [("a", "a"), ("b", "b")]
+
+
+# -------------------------
+# PARCHES DE LA TABLA DE PIEZAS
+# -------------------------
+@pytest.mark.parametrize("modo", ALMACENES)
+def test_parches_de_tabla_de_piezas(carpeta, modo):
+    original = "".join(f"línea {i}\n" for i in range(2000))
+    escribir_json(main.DATA_FILE, [{"nombre": "grande", "text": original}, {"nombre": "otra", "text": "intacta"}])
+    notas = reabrir(modo)
+    item = next(iter(notas))
+
+    tabla = main.TablaPiezas(original)
+    tabla.reemplazar(0, 0, "inicio\n")
+    tabla.reemplazar(100, 120, "ñ")
+    tabla.reemplazar(len(tabla) - 5, len(tabla), "fin")
+    esperado = str(tabla)
+    assert main.aplicar_cambios(original, tabla.cambios) == esperado
+    main.nota_parchear(notas, dict(item, text=esperado), tabla.cambios)
+
+    recargadas = reabrir(modo)
+    assert textos(recargadas) == [("grande", esperado), ("otra", "intacta")]
+
+
+# -------------------------
+# IMPORTACIÓN REANUDABLE
+# -------------------------
+class Corte(Exception):
+    pass
+
+
+@pytest.mark.parametrize("modo", ALMACENES)
+def test_importacion_cortada_se_reanuda(carpeta, modo):
+    escribir_json(main.DATA_FILE, [{"id": "previa", "nombre": "previa", "text": "ya estaba"}])
+    reabrir(modo)
+    origen = carpeta / "notas.ndjson"
+    origen.write_text("".join(json.dumps({"nombre": f"imp{i}", "text": f"t{i}"}) + "\n" for i in range(25)))
+    lotes = []
+
+    def confirmar(lote):
+        if len(lotes) == 2:
+            raise Corte()
+        lotes.append(len(lote))
+        main.nota_importar(lote)
+
+    with pytest.raises(Corte):
+        main.importar_notas(str(origen), confirmar, tam=10)
+    main.escrituras.flush()
+    progreso = main.leer_progreso(["importar", str(origen)])
+    assert progreso["hechas"] == 20
+
+    # repetir la misma importación sigue donde se cortó: solo falta el último lote
+    lotes.clear()
+    assert main.importar_notas(str(origen), confirmar, tam=10) == 25
+    assert lotes == [5]
+    assert not (carpeta / main.DATA_TRANSFERENCIA).exists()
+
+    notas = reabrir(modo)
+    assert [item["nombre"] for item in notas] == ["previa"] + [f"imp{i}" for i in range(25)]
+    assert notas.get("previa")["text"] == "ya estaba"
+
+
+def test_importacion_normaliza_los_ids(carpeta):
+    escribir_json(main.DATA_FILE, [{"id": "previa", "nombre": "previa", "text": ""}])
+    notas = reabrir("json")
+    origen = carpeta / "notas.ndjson"
+    ids = [5, "siete", "../fuera", "a\\b", "", None, "previa"]
+    origen.write_text("".join(json.dumps({"id": i, "nombre": f"imp{n}", "text": ""}) + "\n" for n, i in enumerate(ids)))
+    lotes = []
+    main.importar_notas(str(origen), lotes.append, tam=3)
+
+    importados = [item["id"] for lote in lotes for item in lote]
+    assert importados[:2] == ["5", "siete"] and importados[-1] == "previa"
+    assert all(isinstance(i, str) and main.id_importado(i) == i for i in importados)
+    assert len(set(importados)) == len(ids)
+    # ids str de ambos orígenes conviven en el índice de orden y en la carpeta exportada
+    main.nota_lote(notas, [item for lote in lotes for item in lote], [], sellar=False)
+    orden = main.IndiceOrden()
+    orden.agregar_lote(notas)
+    main.exportar_notas(notas.lista(), str(carpeta / "md"))
+    assert not (carpeta / "fuera.md").exists()
+    assert len(list((carpeta / "md").iterdir())) == len(notas) == len(ids)
+
+
+@pytest.mark.parametrize("modo, archivo", [("json", main.DATA_FILE), ("split", main.DATA_SPLIT_INDEX)])
+def test_importacion_reescribe_el_almacen_una_vez(carpeta, modo, archivo):
+    escribir_json(main.DATA_FILE, [{"id": i, "nombre": i, "text": i} for i in ("a", "b")])
+    reabrir(modo)
+    main.escrituras.flush()  # los snippets que faltaban ya están guardados
+    antes = (carpeta / archivo).read_bytes()
+    origen = carpeta / "notas.ndjson"
+    filas = [("b", "b2"), ("c", "c1"), ("c", "c2"), ("d", "d1")]
+    origen.write_text("".join(json.dumps({"id": i, "nombre": i, "text": t}) + "\n" for i, t in filas))
+
+    main.importar_notas(str(origen), main.nota_importar, tam=1)
+    # los lotes solo se anexan: el archivo principal no se ha reescrito
+    assert (carpeta / archivo).read_bytes() == antes
+    main._almacen.terminar_importacion()
+    assert (carpeta / archivo).read_bytes() != antes
+
+    # el id repetido se queda con su última versión; el reemplazado, en su sitio
+    notas = reabrir(modo)
+    assert textos(notas) == [("a", "a"), ("b", "b2"), ("c", "c2"), ("d", "d1")]
+
+
+def test_importacion_sin_terminar_se_fusiona_al_cargar(carpeta):
+    escribir_json(main.DATA_FILE, [{"id": "a", "nombre": "a", "text": "a"}])
+    reabrir("json")
+    main.nota_importar([{"id": "b", "nombre": "b", "text": "b"}])
+    with open(main.DATA_IMPORTACION, "ab") as f:
+        f.write(b'{"id": "c", "nom')  # corte a mitad de línea
+    main.nota_importar([{"id": "d", "nombre": "d", "text": "d"}])
+
+    assert textos(reabrir("json")) == [("a", "a"), ("b", "b"), ("d", "d")]
+    assert not (carpeta / main.DATA_IMPORTACION).exists()
+
+
+@pytest.mark.parametrize("modo", ALMACENES)
+def test_exportacion_sin_pantalla_recorre_el_almacen(carpeta, modo):
+    originales = [{"id": f"n{i}", "nombre": f"n{i}", "text": f"cuerpo {i}"} for i in range(5)]
+    escribir_json(main.DATA_FILE, originales)
+    reabrir(modo)
+    destino = carpeta / "salida.ndjson"
+    assert main.exportar_notas(main._almacen.recorrer(), str(destino), tam=2) == 5
+    exportadas = [json.loads(linea) for linea in destino.read_text().splitlines()]
+    assert textos(exportadas) == textos(originales)
+    assert [item["id"] for item in exportadas] == [item["id"] for item in originales]
+
+
+def test_importacion_sin_pantalla_espera_a_que_se_cierre_la_app(carpeta, monkeypatch):
+    escribir_json(main.DATA_FILE, [{"id": "previa", "nombre": "previa", "text": ""}])
+    origen = carpeta / "notas.ndjson"
+    origen.write_text(json.dumps({"id": "nueva", "nombre": "nueva", "text": ""}) + "\n")
+    monkeypatch.setattr(main, "uso_almacen", main.UsoAlmacen())
+    app = main.UsoAlmacen()
+    assert app.compartir()
+
+    # con la app abierta no se toca nada: al guardar reescribiría lo importado
+    with pytest.raises(SystemExit) as salida:
+        main.main_transferencia(["importar", str(origen)])
+    assert salida.value.code == 1
+    assert not (carpeta / main.DATA_IMPORTACION).exists()
+
+    app._f.close()
+    main.main_transferencia(["importar", str(origen)])
+    main.uso_almacen._f.close()
+    assert [item["id"] for item in reabrir("json")] == ["previa", "nueva"]